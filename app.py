@@ -1,11 +1,14 @@
 import streamlit as st
 import os
-import tempfile
 import traceback
+import uuid
 from src.processor import PDFProcessor
 from src.config import Config
+from src.docpool import mupdf_lock
+from src.preview import PreviewEngine
+from src.scheduler import PRIORITY_BACKGROUND, get_scheduler
 from src.tracker import UsageTracker
-from PIL import Image
+from src.workspace import get_workspace_manager
 
 # Page Config
 st.set_page_config(
@@ -63,6 +66,124 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Shared job scheduler (one per server process, bounded concurrency across sessions)
+scheduler = get_scheduler()
+# Shared workspace manager (isolated per-job directories with TTL / quota eviction)
+workspaces = get_workspace_manager()
+
+def submit_job(job_key, func, cost, memory_bytes, name):
+    """
+    Submits func(job, output_dir) to the shared job scheduler and keeps the job in
+    the session, so it keeps running (and stays visible) across reruns.
+    Every job writes into its own workspace, so users never overwrite each other.
+    """
+    old_job = st.session_state.get(job_key)
+    if old_job is not None and not old_job.done:
+        scheduler.cancel(old_job)
+    else:
+        old_job = None
+    # The real job takes over from the speculative warm-up (see start_warmup)
+    warmup_job = st.session_state.get("warmup_job")
+    if warmup_job is not None and not warmup_job.done:
+        scheduler.cancel(warmup_job)
+    output_dir = workspaces.workspace(f"out-{uuid.uuid4().hex}")
+
+    def run(job):
+        # The cancelled job owns its checkpoint until it stops at its next page; wait for
+        # it, so a rerun with the same settings resumes there instead of starting over
+        if old_job is not None:
+            while not old_job.wait(timeout=0.5):
+                job.cancel_token.raise_if_cancelled()
+        return func(job, output_dir)
+
+    st.session_state[job_key] = scheduler.submit(
+        run,
+        cost=cost,
+        memory_bytes=memory_bytes,
+        name=name
+    )
+
+def start_warmup(processor, filename, enable_ocr):
+    """
+    Starts precomputing the uploaded document's rasters, OCR and classification
+    as a background-priority job, while the user is still adjusting settings.
+    It yields to every other job; whatever it finished is reused from the shared caches.
+    """
+    old_job = st.session_state.get("warmup_job")
+    if old_job is not None and not old_job.done:
+        scheduler.cancel(old_job)
+    if not Config.WARMUP_ON_UPLOAD:
+        return
+
+    def warm_up(job):
+        # Its own document handle, the session's processor keeps serving the UI
+        return PDFProcessor(processor.input_path).warm_caches(
+            enable_ocr=enable_ocr,
+            progress_callback=job.update_progress,
+            cancel_token=job.cancel_token
+        )
+
+    cost, memory_bytes = processor.estimate_job(dpi=Config.DPI, enable_ocr=enable_ocr)
+    st.session_state.warmup_job = scheduler.submit(
+        warm_up,
+        cost=cost,
+        memory_bytes=memory_bytes,
+        name=f"warmup:{filename}",
+        priority=PRIORITY_BACKGROUND
+    )
+
+def follow_job(job_key):
+    """
+    Shows the queue position / progress of the session's job until it finishes.
+    Returns the job result, or None if there is no finished job.
+    Re-raises the exception of a failed job.
+    """
+    job = st.session_state.get(job_key)
+    if job is None:
+        return None
+    
+    if not job.done:
+        if st.button("⏹️ 取消 (Cancel)", key=f"cancel_{job_key}"):
+            scheduler.cancel(job)
+        progress_bar = st.progress(0)
+        status_text = st.empty()
+        try:
+            while not job.wait(timeout=0.3):
+                position = scheduler.position(job)
+                if position > 0:
+                    status_text.text(f"⏳ 排隊中 (Queued): 第 {position} 位，前方還有 {position - 1} 個工作")
+                elif job.cancel_token.cancelled:
+                    status_text.text("正在取消 (Cancelling)...")
+                else:
+                    progress_bar.progress(min(1.0, job.progress))
+                    status_text.text(job.message)
+        finally:
+            progress_bar.empty()
+            status_text.empty()
+    
+    if job.status == "cancelled":
+        del st.session_state[job_key]
+        st.warning("已取消。已完成的頁面會保留，再次執行相同設定時將從中斷處繼續。")
+        return None
+    if job.error:
+        del st.session_state[job_key]
+        raise job.error
+    return job.result
+
+def read_output(job_key, path):
+    """
+    Returns the bytes of a finished job's output file. They are read once and
+    kept in the session: workspace eviction may remove the file while the
+    session still offers it for download.
+    """
+    cache_key = f"{job_key}:output"
+    cached = st.session_state.get(cache_key)
+    if cached is None or cached[0] != path:
+        with open(path, "rb") as f:
+            cached = (path, f.read())
+        st.session_state[cache_key] = cached
+    return cached[1]
+
 # Main Area - File Uploader
 # User Identification
 st.markdown("### 👤 使用者登入 (User Login)")
@@ -198,10 +319,14 @@ else:
 # uploaded_file = st.file_uploader("上傳 NotebookLM PDF", type=["pdf"])
 
 if uploaded_file is not None:
-    # Save uploaded file to temp
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-        tmp_file.write(uploaded_file.getvalue())
-        tmp_path = tmp_file.name
+    # Save uploaded file into its workspace (once per upload, reused across reruns)
+    upload_key = getattr(uploaded_file, "file_id", uploaded_file.name)
+    if st.session_state.get("upload_key") != upload_key or not os.path.exists(st.session_state.get("upload_path", "")):
+        st.session_state.upload_path = workspaces.store_upload(uploaded_file.getvalue(), uploaded_file.name)
+        st.session_state.upload_key = upload_key
+    else:
+        workspaces.touch(st.session_state.upload_path)
+    tmp_path = st.session_state.upload_path
 
     st.success(f"檔案已上傳: {uploaded_file.name}")
     
@@ -213,27 +338,50 @@ if uploaded_file is not None:
     # Initialize Processor
     processor = PDFProcessor(tmp_path, font_path=selected_font_path)
 
+    # OCR Pre-pass (cheap, so run it once per upload before any job starts)
+    if "page_kinds" not in st.session_state or st.session_state.get("kinds_key") != upload_key:
+        st.session_state.page_kinds = processor.classify_pages()
+        st.session_state.kinds_key = upload_key
+    page_kinds = st.session_state.page_kinds
+    kind_labels = {"native": "原生文字", "mixed": "混合", "needs_ocr": "需 OCR"}
+    kind_counts = {kind: sum(1 for info in page_kinds if info["kind"] == kind) for kind in kind_labels}
+    pages_need_ocr = kind_counts["needs_ocr"] + kind_counts["mixed"] > 0
+
+    # Speculative warm-up, once per upload
+    if st.session_state.get("warmup_key") != upload_key:
+        start_warmup(processor, uploaded_file.name, enable_ocr=Config.WARMUP_OCR and pages_need_ocr)
+        st.session_state.warmup_key = upload_key
+
     # Preview Section
-    st.subheader("👀 預覽 (Preview - Page 1)")
+    # The engine keeps display-size rasters across reruns, a slider move only re-applies the patch
+    if st.session_state.get("preview_key") != upload_key:
+        st.session_state.preview_engine = PreviewEngine(processor)
+        st.session_state.preview_key = upload_key
+    preview = st.session_state.preview_engine
+    preview_page = st.number_input("預覽頁面 (Preview Page)", min_value=1, max_value=processor.page_count, value=1, step=1) - 1
+
+    st.subheader(f"👀 預覽 (Preview - Page {preview_page + 1})")
+    st.caption(
+        "🔎 OCR 需求分析 (OCR Check): "
+        + " · ".join(f"{label} {kind_counts[kind]} 頁" for kind, label in kind_labels.items())
+    )
     col1, col2 = st.columns(2)
     
     with col1:
         st.markdown("**原始頁面 (Original)**")
-        # Render original first page
-        page1 = processor.doc[0]
-        pix = page1.get_pixmap(dpi=150)
-        img_original = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+        img_original = preview.base(preview_page)
         st.image(img_original, width="stretch")
         
         # Debug Info: Check text blocks
-        text_blocks = page1.get_text("blocks")
+        with mupdf_lock:
+            text_blocks = processor.doc[preview_page].get_text("blocks")
         num_blocks = len(text_blocks)
         st.caption(f"🔍 偵測到的文字區塊數: {num_blocks}")
         
         if num_blocks > 0:
             with st.expander("查看提取的文字數據 (Debug Data)"):
                 # Extract using our method to see exactly what we are getting
-                elements = processor.extract_elements(0)
+                elements = processor.extract_elements(preview_page)
                 for i, elem in enumerate(elements[:5]):
                     st.text(f"Text: {elem['text'][:20]}...")
                     st.text(f"Size: {elem['size']:.2f} | Color: {elem['color']}")
@@ -247,55 +395,31 @@ if uploaded_file is not None:
         st.markdown("**處理後背景 (Cleaned Background)**")
         # Show what the background looks like (cleaned)
         if remove_watermark:
-            img_cleaned = processor.clean_page_image(0, dpi=150, wm_settings=wm_settings)
-            
-            # Draw visualization boxes for UI feedback (only on preview, not on result)
-            # We need a copy to draw on
-            img_preview = img_cleaned.copy()
-            from PIL import ImageDraw
-            draw = ImageDraw.Draw(img_preview)
-            w, h = img_preview.size
-            
-            # Draw Target Box (Red)
-            tx = int(w * wm_settings["x_start"])
-            ty = int(h * wm_settings["y_start"])
-            tw = int(w * wm_settings["width"])
-            th = int(h * wm_settings["height"])
-            draw.rectangle([tx, ty, tx+tw, ty+th], outline="red", width=3)
-            
-            # Draw Source Box
-            if wm_settings.get("use_mirror_patch"):
-                # Calculate symmetric source
-                sx = w - (tx + tw)
-                sy = ty
-                draw.rectangle([sx, sy, sx+tw, sy+th], outline="blue", width=3)
-                caption = "紅框: 消除區域 | 藍框: 鏡像來源 (自動計算)"
-            elif wm_settings.get("use_patch"):
-                sx = int(w * wm_settings["src_x"])
-                sy = int(h * wm_settings["src_y"])
-                draw.rectangle([sx, sy, sx+tw, sy+th], outline="#00ff00", width=3)
-                caption = "紅框: 消除區域 | 綠框: 手動來源"
-            else:
-                caption = "紅框: 消除區域 (白色遮蓋)"
-                
-            st.image(img_preview, width="stretch", caption=caption)
+            # Boxes are drawn for UI feedback only (on the preview, not on the result)
+            _, img_preview, patch_source = preview.render(preview_page, wm_settings)
+            captions = {
+                "mirror": "紅框: 消除區域 | 藍框: 鏡像來源 (自動計算)",
+                "manual": "紅框: 消除區域 | 綠框: 手動來源",
+                "mask": "紅框: 消除區域 (白色遮蓋)"
+            }
+            st.image(img_preview, width="stretch", caption=captions[patch_source])
         else:
             st.info("浮水印去除已關閉")
             st.image(img_original, width="stretch")
             
     # Full Page Preview Expander
     with st.expander("👀 預覽所有頁面 (Preview All Pages)"):
-        if "thumbnails" not in st.session_state or st.session_state.get("thumb_file") != uploaded_file.name:
+        if "thumbnails" not in st.session_state or st.session_state.get("thumb_key") != upload_key:
              with st.spinner("正在生成頁面預覽 (Generating Previews)..."):
                  st.session_state.thumbnails = processor.get_page_thumbnails()
-                 st.session_state.thumb_file = uploaded_file.name
+                 st.session_state.thumb_key = upload_key
         
         # Grid Layout for Thumbnails
         cols = st.columns(4)
         pages_to_remove = []
         for i, (page_num, img) in enumerate(st.session_state.thumbnails):
             with cols[i % 4]:
-                st.image(img, caption=f"Page {page_num}", width="stretch")
+                st.image(img, caption=f"Page {page_num} · {kind_labels[page_kinds[page_num - 1]['kind']]}", width="stretch")
                 # Checkbox for deletion
                 # Use a unique key for each checkbox
                 del_key = f"del_page_{page_num}"
@@ -314,41 +438,41 @@ if uploaded_file is not None:
             if not uploaded_file:
                 st.warning("請先上傳 PDF 檔案。")
             else:
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                
-                def update_progress(progress, message):
-                    progress_bar.progress(progress)
-                    status_text.text(message)
-
-                try:
-                    output_path = processor.render_new_pdf(
+                cost, memory_bytes = processor.estimate_job(dpi=Config.DPI, pages_to_remove=pages_to_remove)
+                submit_job(
+                    f"pdf_job:{uploaded_file.name}",
+                    lambda job, output_dir: processor.render_new_pdf(
                         wm_settings=wm_settings, 
                         debug_mode=debug_mode, 
                         enable_ocr=False,
-                        progress_callback=update_progress,
-                        pages_to_remove=pages_to_remove
-                    )
-                    st.success("PDF 生成成功！")
+                        progress_callback=job.update_progress,
+                        pages_to_remove=pages_to_remove,
+                        cancel_token=job.cancel_token,
+                        output_dir=output_dir
+                    ),
+                    cost=cost,
+                    memory_bytes=memory_bytes,
+                    name=f"pdf:{uploaded_file.name}"
+                )
+        
+        try:
+            output_path = follow_job(f"pdf_job:{uploaded_file.name}")
+            if output_path:
+                st.success("PDF 生成成功！")
+                
+                def log_pdf_download():
+                    tracker.log_action(user_name, "Download PDF", f"{processor.filename}_enhanced.pdf")
                     
-                    def log_pdf_download():
-                        tracker.log_action(user_name, "Download PDF", f"{processor.filename}_enhanced.pdf")
-                        
-                    with open(output_path, "rb") as f:
-                        st.download_button(
-                            label="📥 下載增強版 PDF",
-                            data=f,
-                            file_name=f"{processor.filename}_enhanced.pdf",
-                            mime="application/pdf",
-                            on_click=log_pdf_download
-                        )
-                except Exception as e:
-                    st.error(f"發生錯誤: {e}")
-                    import traceback
-                    st.code(traceback.format_exc())
-                finally:
-                    progress_bar.empty()
-                    status_text.empty()
+                st.download_button(
+                    label="📥 下載增強版 PDF",
+                    data=read_output(f"pdf_job:{uploaded_file.name}", output_path),
+                    file_name=f"{processor.filename}_enhanced.pdf",
+                    mime="application/pdf",
+                    on_click=log_pdf_download
+                )
+        except Exception as e:
+            st.error(f"發生錯誤: {e}")
+            st.code(traceback.format_exc())
 
     with tab_edit:
         st.info("在此頁籤中，您可以直接修改 PDF 內的文字內容。")
@@ -357,10 +481,10 @@ if uploaded_file is not None:
             st.markdown("### 1. 選擇要分析的頁面 (Select Pages)")
             st.info("請勾選需要編輯文字的頁面。未勾選的頁面將保持原樣。")
             
-            if "thumbnails" not in st.session_state or st.session_state.get("thumb_file") != uploaded_file.name:
+            if "thumbnails" not in st.session_state or st.session_state.get("thumb_key") != upload_key:
                  with st.spinner("正在生成頁面預覽 (Generating Previews)..."):
                      st.session_state.thumbnails = processor.get_page_thumbnails()
-                     st.session_state.thumb_file = uploaded_file.name
+                     st.session_state.thumb_key = upload_key
             
             # Select All / Deselect All Buttons
             col_btn1, col_btn2, _ = st.columns([1, 1, 4])
@@ -396,26 +520,32 @@ if uploaded_file is not None:
                 if not selected_pages:
                     st.warning("請至少選擇一頁！ (Please select at least one page)")
                 else:
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    
-                    def update_progress(progress, message):
-                        progress_bar.progress(progress)
-                        status_text.text(message)
-
-                    try:
-                        st.session_state.text_data = processor.extract_text_data(
+                    cost, memory_bytes = processor.estimate_job(
+                        dpi=Config.OCR_DPI,
+                        pages_to_remove=[p for p in range(processor.page_count) if p + 1 not in selected_pages],
+                        enable_ocr=True
+                    )
+                    submit_job(
+                        f"text_job:{uploaded_file.name}",
+                        lambda job, output_dir: processor.extract_text_data(
                             pages=selected_pages,
-                            progress_callback=update_progress
-                        )
-                        st.session_state.file_name = uploaded_file.name
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"發生錯誤: {e}")
-                        st.code(traceback.format_exc())
-                    finally:
-                        progress_bar.empty()
-                        status_text.empty()
+                            progress_callback=job.update_progress
+                        ),
+                        cost=cost,
+                        memory_bytes=memory_bytes,
+                        name=f"text:{uploaded_file.name}"
+                    )
+            
+            try:
+                text_data = follow_job(f"text_job:{uploaded_file.name}")
+                if text_data is not None:
+                    del st.session_state[f"text_job:{uploaded_file.name}"]
+                    st.session_state.text_data = text_data
+                    st.session_state.file_name = uploaded_file.name
+                    st.rerun()
+            except Exception as e:
+                st.error(f"發生錯誤: {e}")
+                st.code(traceback.format_exc())
         
         if "text_data" in st.session_state:
             # Display data editor
@@ -454,39 +584,48 @@ if uploaded_file is not None:
                 generate_clicked = st.button("💾 生成編輯後的 PDF", type="primary", width="stretch")
 
             if generate_clicked:
-                with st.spinner("正在生成 PDF (Processing)..."):
-                    try:
-                        # Map UI selection to internal mode string
-                        mode_map = {
-                            "Blur (高斯模糊)": "Blur",
-                            "Smart Fill (周圍底色)": "Smart Fill",
-                            "White (固定白色)": "White"
-                        }
-                        selected_mode = mode_map[bg_mode]
-                        
-                        output_path = processor.apply_text_edits(
-                            edited_data, 
-                            font_path=selected_font_path, 
-                            wm_settings=wm_settings,
-                            bg_mode=selected_mode
-                        )
-                        st.success("編輯完成！")
-                        
-                        def log_edited_pdf_download():
-                            tracker.log_action(user_name, "Download Edited PDF", f"{processor.filename}_edited.pdf")
-
-                        with open(output_path, "rb") as f:
-                            st.download_button(
-                                label="📥 下載編輯後的 PDF",
-                                data=f,
-                                file_name=f"{processor.filename}_edited.pdf",
-                                mime="application/pdf",
-                                type="primary",
-                                on_click=log_edited_pdf_download
-                            )
-                    except Exception as e:
-                        st.error(f"發生錯誤: {e}")
-                        st.code(traceback.format_exc())
+                # Map UI selection to internal mode string
+                mode_map = {
+                    "Blur (高斯模糊)": "Blur",
+                    "Smart Fill (周圍底色)": "Smart Fill",
+                    "White (固定白色)": "White"
+                }
+                selected_mode = mode_map[bg_mode]
+                
+                cost, memory_bytes = processor.estimate_job(dpi=Config.DPI)
+                submit_job(
+                    f"edit_job:{uploaded_file.name}",
+                    lambda job, output_dir: processor.apply_text_edits(
+                        edited_data, 
+                        font_path=selected_font_path, 
+                        wm_settings=wm_settings,
+                        bg_mode=selected_mode,
+                        output_dir=output_dir
+                    ),
+                    cost=cost,
+                    memory_bytes=memory_bytes,
+                    name=f"edit:{uploaded_file.name}"
+                )
+            
+            try:
+                output_path = follow_job(f"edit_job:{uploaded_file.name}")
+                if output_path:
+                    st.success("編輯完成！")
+                    
+                    def log_edited_pdf_download():
+                        tracker.log_action(user_name, "Download Edited PDF", f"{processor.filename}_edited.pdf")
+
+                    st.download_button(
+                        label="📥 下載編輯後的 PDF",
+                        data=read_output(f"edit_job:{uploaded_file.name}", output_path),
+                        file_name=f"{processor.filename}_edited.pdf",
+                        mime="application/pdf",
+                        type="primary",
+                        on_click=log_edited_pdf_download
+                    )
+            except Exception as e:
+                st.error(f"發生錯誤: {e}")
+                st.code(traceback.format_exc())
 
     with tab_pptx:
         st.info("將 PDF 轉換為 PowerPoint 投影片。")
@@ -498,52 +637,59 @@ if uploaded_file is not None:
             help="Re-render: 重新繪製清晰文字 (適合模糊文件)\nOverlay: 保留原始背景，疊加隱形文字 (適合保留原始排版)"
         )
         
+        if pages_need_ocr:
+            st.caption(f"🔎 偵測到 {kind_counts['needs_ocr'] + kind_counts['mixed']} 頁含有圖片文字，建議啟用 OCR。")
+        
         enable_ocr_pptx = st.checkbox(
             "啟用 OCR (Enable OCR)", 
-            value=False, 
+            value=pages_need_ocr, 
             help="若 PDF 為純圖片或掃描檔，請勾選此項。若為一般 PDF (已有文字)，請取消勾選以大幅提升轉換速度。"
         )
         
         if st.button("📊 轉為 PPTX", width="stretch"):
-            progress_bar = st.progress(0)
-            status_text = st.empty()
+            # Map UI selection to internal mode string
+            mode_map = {
+                "Re-render (重繪模式)": "re-render",
+                "Overlay (疊加模式)": "overlay"
+            }
+            selected_mode = mode_map[pptx_mode]
             
-            def update_progress(progress, message):
-                progress_bar.progress(progress)
-                status_text.text(message)
-
-            try:
-                # Map UI selection to internal mode string
-                mode_map = {
-                    "Re-render (重繪模式)": "re-render",
-                    "Overlay (疊加模式)": "overlay"
-                }
-                selected_mode = mode_map[pptx_mode]
-                
-                pptx_path = processor.convert_to_pptx(
+            cost, memory_bytes = processor.estimate_job(
+                dpi=Config.PPTX_DPI,
+                pages_to_remove=pages_to_remove,
+                enable_ocr=enable_ocr_pptx
+            )
+            submit_job(
+                f"pptx_job:{uploaded_file.name}",
+                lambda job, output_dir: processor.convert_to_pptx(
                     wm_settings=wm_settings, 
                     text_mode=selected_mode,
                     enable_ocr=enable_ocr_pptx,
-                    progress_callback=update_progress,
-                    pages_to_remove=pages_to_remove
-                )
+                    progress_callback=job.update_progress,
+                    pages_to_remove=pages_to_remove,
+                    cancel_token=job.cancel_token,
+                    output_dir=output_dir
+                ),
+                cost=cost,
+                memory_bytes=memory_bytes,
+                name=f"pptx:{uploaded_file.name}"
+            )
+        
+        try:
+            pptx_path = follow_job(f"pptx_job:{uploaded_file.name}")
+            if pptx_path:
                 st.success("PPTX 轉換成功！")
                 
                 def log_pptx_download():
                     tracker.log_action(user_name, "Download PPTX", f"{processor.filename}.pptx")
 
-                with open(pptx_path, "rb") as f:
-                    st.download_button(
-                        label="📥 下載 PPTX",
-                        data=f,
-                        file_name=f"{processor.filename}.pptx",
-                        mime="application/vnd.openxmlformats-officedocument.presentationml.presentation",
-                        on_click=log_pptx_download
-                    )
-            except Exception as e:
+                st.download_button(
+                    label="📥 下載 PPTX",
+                    data=read_output(f"pptx_job:{uploaded_file.name}", pptx_path),
+                    file_name=f"{processor.filename}.pptx",
+                    mime="application/vnd.openxmlformats-officedocument.presentationml.presentation",
+                    on_click=log_pptx_download
+                )
+        except Exception as e:
                 st.error(f"發生錯誤: {e}")
-                import traceback
                 st.code(traceback.format_exc())
-            finally:
-                progress_bar.empty()
-                status_text.empty()
@@ -0,0 +1,58 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from src.config import Config
+
+# Runs in a fresh interpreter so nothing is already imported
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{"elapsed_ms": elapsed_ms, "modules": sorted(sys.modules)}}))
+"""
+
+
+def measure(module):
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module)],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks the import time of src.processor against Config.STARTUP_IMPORT_BUDGET_MS.")
+    parser.add_argument("--module", default="src.processor", help="Module to import")
+    parser.add_argument("--runs", type=int, default=5, help="Number of runs (best one counts)")
+    parser.add_argument("--budget", type=float, default=Config.STARTUP_IMPORT_BUDGET_MS, help="Budget in milliseconds")
+    args = parser.parse_args()
+
+    # 1. Measure
+    runs = [measure(args.module) for _ in range(args.runs)]
+    best_ms = min(run["elapsed_ms"] for run in runs)
+    print(f"import {args.module}: best {best_ms:.0f} ms over {args.runs} runs (budget {args.budget:.0f} ms)")
+
+    # 2. Check that heavy dependencies stayed deferred
+    loaded = set(runs[0]["modules"])
+    eager = [name for name in Config.STARTUP_DEFERRED_MODULES if name in loaded]
+
+    failed = False
+    if best_ms > args.budget:
+        print(f"FAIL: import time over budget by {best_ms - args.budget:.0f} ms")
+        failed = True
+    if eager:
+        print(f"FAIL: imported at startup, should be deferred to first use: {', '.join(eager)}")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
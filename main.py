@@ -2,12 +2,15 @@ import argparse
 import os
 from src.processor import PDFProcessor
 from src.config import Config
+from src.merge import parse_page_ranges
 
 def main():
     parser = argparse.ArgumentParser(description="NotebookLM PDF Enhancer")
     parser.add_argument("input_file", help="Path to the input PDF file")
     parser.add_argument("--format", choices=["pdf", "pptx", "all"], default="all", help="Output format")
     parser.add_argument("--font", help="Path to custom font file", default=None)
+    parser.add_argument("--zip", action="store_true", help="Also write a ZIP of the page images")
+    parser.add_argument("--pages", help="Only process these pages, e.g. 1-40,45 (outputs a fragment, see merge.py)", default=None)
     
     args = parser.parse_args()
     
@@ -22,14 +25,21 @@ def main():
     print(f"Processing: {input_path}")
     
     processor = PDFProcessor(input_path, font_path=args.font)
+
+    pages = None
+    if args.pages:
+        try:
+            pages = parse_page_ranges(args.pages, processor.page_count)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
     
-    if args.format in ["pdf", "all"]:
-        print("Generating Enhanced PDF...")
-        processor.render_new_pdf()
-        
-    if args.format in ["pptx", "all"]:
-        print("Generating PPTX...")
-        processor.convert_to_pptx()
+    # Every requested output comes out of one pass over the pages
+    formats = ["pdf", "pptx"] if args.format == "all" else [args.format]
+    if args.zip:
+        formats.append("zip")
+    print(f"Generating {', '.join(f.upper() for f in formats)}...")
+    processor.render_outputs(formats, pages=pages)
         
     print("Done!")
 
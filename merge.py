@@ -0,0 +1,23 @@
+import argparse
+import os
+from src.merge import merge_fragments
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge page-range fragments produced with main.py --pages")
+    parser.add_argument("fragments", nargs="+", help="PDF or PPTX fragment files (sorted by their _pA-B suffix)")
+    parser.add_argument("-o", "--output", required=True, help="Path of the merged file")
+
+    args = parser.parse_args()
+
+    missing = [path for path in args.fragments if not os.path.exists(path)]
+    if missing:
+        print(f"Error: Fragment(s) not found: {', '.join(missing)}")
+        return
+
+    try:
+        merge_fragments(args.fragments, args.output)
+    except ValueError as e:
+        print(f"Error: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Headless job service: keeps the OCR engine, worker pool, caches and fonts
+warm in one long-lived process and runs conversions submitted over HTTP
+(TCP or a Unix socket). Several replicas can run behind a load balancer.
+
+API:
+    POST   /jobs?format=pdf|pptx&filename=deck.pdf   body: the PDF file
+           optional: enable_ocr=1, text_mode=re-render|overlay,
+                     remove_pages=3,5 (1-based), wm_settings=<JSON>,
+                     pages=1-40 (only this range, the result is a fragment for merge.py)
+    GET    /jobs/<id>          job status (JSON)
+    GET    /jobs/<id>/events   progress stream, one JSON object per line
+    GET    /jobs/<id>/result   the finished PDF/PPTX
+    DELETE /jobs/<id>          cancel the job
+    GET    /health             scheduler stats
+
+Example:
+    python service.py --port 8765
+    curl -X POST --data-binary @deck.pdf "http://127.0.0.1:8765/jobs?format=pptx&filename=deck.pdf"
+    curl -N http://127.0.0.1:8765/jobs/<id>/events
+    curl -o deck.pptx http://127.0.0.1:8765/jobs/<id>/result
+"""
+import argparse
+import importlib
+import json
+import os
+import socketserver
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from src.config import Config
+from src.merge import parse_page_ranges
+from src.ocr_cache import get_ocr_cache
+from src.ocr_pool import get_ocr_engine, get_ocr_pool
+from src.processor import PDFProcessor, load_font
+from src.scheduler import get_scheduler
+from src.workspace import get_workspace_manager
+
+CONTENT_TYPES = {
+    ".pdf": "application/pdf",
+    ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+}
+
+
+class JobRegistry:
+    """
+    Jobs submitted to this service, by id. Finished jobs are forgotten after
+    Config.SERVICE_JOB_RETENTION_SECONDS (their output workspaces are evicted
+    separately by the WorkspaceManager).
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def add(self, job):
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.done and job.finished_at and now - job.finished_at > Config.SERVICE_JOB_RETENTION_SECONDS
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+registry = JobRegistry()
+
+
+def warm_up(ocr=True):
+    """
+    Loads everything a job would otherwise load on first use.
+    Call before the scheduler starts its threads: the OCR pool starts processes.
+    """
+    start = time.time()
+
+    # 1. Libraries deferred at import time (see bench_startup.py)
+    for module in ("numpy", "pptx", "opencc"):
+        importlib.import_module(module)
+
+    # 2. Fonts, kept loaded for every later job (see load_font)
+    try:
+        load_font(Config.DEFAULT_FONT_PATH)
+    except Exception as e:
+        print(f"Warning: could not load font {Config.DEFAULT_FONT_PATH}: {e}")
+
+    # 3. OCR: worker pool first (it starts processes), then the in-process engine and the cache
+    if ocr:
+        if Config.OCR_WORKERS != 1:
+            get_ocr_pool()
+        get_ocr_engine()
+        get_ocr_cache()
+
+    print(f"Warm-up done in {time.time() - start:.1f}s")
+
+
+def job_status(job):
+    return {
+        "id": job.id,
+        "name": job.name,
+        "status": job.status,
+        "progress": round(job.progress, 4),
+        "message": job.message,
+        "position": get_scheduler().position(job),
+        "error": str(job.error) if job.error else None
+    }
+
+
+def submit_job(data, params):
+    """
+    Stores the uploaded PDF and queues its conversion. Raises ValueError on bad input.
+    """
+    fmt = params.get("format", "pdf")
+    if fmt not in ("pdf", "pptx"):
+        raise ValueError("format must be pdf or pptx")
+    text_mode = params.get("text_mode", "re-render")
+    if text_mode not in ("re-render", "overlay"):
+        raise ValueError("text_mode must be re-render or overlay")
+    enable_ocr = params.get("enable_ocr", "0").lower() in ("1", "true", "yes")
+    try:
+        pages_to_remove = [int(p) - 1 for p in params["remove_pages"].split(",") if p.strip()] if params.get("remove_pages") else []
+        wm_settings = json.loads(params["wm_settings"]) if params.get("wm_settings") else None
+    except ValueError as e:
+        raise ValueError(f"Invalid parameter: {e}")
+
+    workspaces = get_workspace_manager()
+    filename = os.path.basename(params.get("filename") or "upload.pdf")
+    input_path = workspaces.store_upload(data, filename)
+    try:
+        processor = PDFProcessor(input_path)
+    except Exception as e:
+        raise ValueError(f"Could not open PDF: {e}")
+    pages = parse_page_ranges(params["pages"], processor.page_count) if params.get("pages") else None
+
+    # Pages outside the range cost nothing
+    skipped = pages_to_remove if pages is None else pages_to_remove + [p for p in range(processor.page_count) if p not in pages]
+    cost, memory_bytes = processor.estimate_job(
+        dpi=Config.DPI if fmt == "pdf" else Config.PPTX_DPI,
+        pages_to_remove=skipped,
+        enable_ocr=enable_ocr
+    )
+    output_dir = workspaces.workspace(f"out-{uuid.uuid4().hex}")
+
+    def run(job):
+        try:
+            if fmt == "pdf":
+                return processor.render_new_pdf(
+                    wm_settings=wm_settings,
+                    enable_ocr=enable_ocr,
+                    progress_callback=job.update_progress,
+                    pages_to_remove=pages_to_remove,
+                    cancel_token=job.cancel_token,
+                    output_dir=output_dir,
+                    pages=pages
+                )
+            return processor.convert_to_pptx(
+                wm_settings=wm_settings,
+                text_mode=text_mode,
+                enable_ocr=enable_ocr,
+                progress_callback=job.update_progress,
+                pages_to_remove=pages_to_remove,
+                cancel_token=job.cancel_token,
+                output_dir=output_dir,
+                pages=pages
+            )
+        finally:
+            # The job keeps only its result path; the scheduler drops this closure when it finishes
+            processor.close()
+
+    job = get_scheduler().submit(run, cost=cost, memory_bytes=memory_bytes, name=f"{fmt}:{filename}")
+    registry.add(job)
+    return job
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    server_version = "NotebookLMEnhancer"
+
+    def address_string(self):
+        # Unix socket peers have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def _send_json(self, code, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        # Returns (job, action) for /jobs/<id>[/<action>], job None if unknown
+        parts = [p for p in urlparse(self.path).path.split("/") if p]
+        if len(parts) < 2 or parts[0] != "jobs":
+            return None, None
+        return registry.get(parts[1]), (parts[2] if len(parts) > 2 else "")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            return self._send_json(404, {"error": "Not found"})
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            return self._send_json(400, {"error": "Request body must be the PDF file"})
+        if length > Config.SERVICE_MAX_UPLOAD_BYTES:
+            return self._send_json(413, {"error": "File too large"})
+
+        data = self.rfile.read(length)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            job = submit_job(data, params)
+        except ValueError as e:
+            return self._send_json(400, {"error": str(e)})
+        self._send_json(202, job_status(job))
+
+    def do_GET(self):
+        if urlparse(self.path).path.rstrip("/") == "/health":
+            return self._send_json(200, get_scheduler().stats())
+
+        job, action = self._route()
+        if job is None:
+            return self._send_json(404, {"error": "Unknown job"})
+        if action == "":
+            return self._send_json(200, job_status(job))
+        if action == "events":
+            return self._stream_events(job)
+        if action == "result":
+            return self._send_result(job)
+        self._send_json(404, {"error": "Not found"})
+
+    def do_DELETE(self):
+        job, action = self._route()
+        if job is None or action:
+            return self._send_json(404, {"error": "Unknown job"})
+        get_scheduler().cancel(job)
+        self._send_json(200, job_status(job))
+
+    def _stream_events(self, job):
+        # NDJSON over a plain HTTP/1.0 response, the stream ends when the job does
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        last_event = None
+        last_sent = 0.0
+        try:
+            while True:
+                finished = job.wait(timeout=0.3)
+                event = job_status(job)
+                # Send on change, plus a keep-alive every 15s
+                if event != last_event or time.time() - last_sent > 15:
+                    self.wfile.write(json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n")
+                    self.wfile.flush()
+                    last_event = event
+                    last_sent = time.time()
+                if finished:
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            pass # Client went away, the job keeps running
+
+    def _send_result(self, job):
+        if not job.done:
+            return self._send_json(409, dict(job_status(job), error="Job not finished"))
+        if job.status != "done":
+            return self._send_json(410 if job.status == "cancelled" else 500, job_status(job))
+
+        output_path = job.result
+        if not output_path or not os.path.exists(output_path):
+            return self._send_json(410, dict(job_status(job), error="Result expired"))
+        get_workspace_manager().touch(output_path)
+
+        filename = os.path.basename(output_path)
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES.get(os.path.splitext(filename)[1], "application/octet-stream"))
+        self.send_header("Content-Length", str(os.path.getsize(output_path)))
+        self.send_header("Content-Disposition", f'attachment; filename="{filename}"')
+        self.end_headers()
+        with open(output_path, "rb") as f:
+            while True:
+                chunk = f.read(1024 * 1024)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NotebookLM Enhancer job service")
+    parser.add_argument("--host", default=Config.SERVICE_HOST, help="Address to listen on")
+    parser.add_argument("--port", type=int, default=Config.SERVICE_PORT, help="TCP port to listen on")
+    parser.add_argument("--unix-socket", help="Listen on this Unix socket path instead of TCP")
+    parser.add_argument("--no-ocr-warmup", action="store_true", help="Don't load the OCR engine at startup")
+    args = parser.parse_args()
+
+    warm_up(ocr=not args.no_ocr_warmup)
+    scheduler = get_scheduler()
+
+    if args.unix_socket:
+        if os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+        server = UnixHTTPServer(args.unix_socket, ServiceHandler)
+        print(f"Listening on unix:{args.unix_socket} ({scheduler.max_workers} job workers)")
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), ServiceHandler)
+        server.daemon_threads = True
+        print(f"Listening on http://{args.host}:{args.port} ({scheduler.max_workers} job workers)")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+
+
+if __name__ == "__main__":
+    main()
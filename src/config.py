@@ -6,6 +6,8 @@ class Config:
     FONTS_DIR = os.path.join(BASE_DIR, 'fonts')
     INPUT_DIR = os.path.join(BASE_DIR, 'input')
     OUTPUT_DIR = os.path.join(BASE_DIR, 'output')
+    CACHE_DIR = os.path.join(BASE_DIR, 'cache')
+    WORKSPACE_DIR = os.path.join(BASE_DIR, 'workspaces')  # Per-job uploads, checkpoints and outputs
 
     # Font settings
     # Default to Microsoft JhengHei if available, otherwise fallback
@@ -14,9 +16,129 @@ class Config:
     
     # Fallback font if the primary one isn't found (e.g., system font)
     SYSTEM_FONT_FALLBACK = "C:\\Windows\\Fonts\\msjh.ttc"
+    # Last resort for generated text on Linux / cloud hosts
+    CJK_FONT_FALLBACK = "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc"
+    # Embed only the glyphs generated PDFs actually use
+    FONT_SUBSET = True
 
     # PDF Generation settings
     DPI = 300  # High resolution for background images
+    PPTX_DPI = 150  # PPTX backgrounds, lower to keep the file light
+    # Pages whose raster at DPI would exceed this are rendered in horizontal bands
+    RENDER_BAND_THRESHOLD_PIXELS = 40_000_000
+    RENDER_BAND_HEIGHT = 1024  # Band height in pixels
+
+    # Document handle pool (see src/docpool.py): page tasks borrow a handle instead of sharing one
+    DOC_POOL_MAX_HANDLES = 1  # Handles per document, further borrowers wait (MuPDF calls are serialised anyway)
+    DOC_POOL_IDLE_SECONDS = 60  # Idle handles are closed after this long
+
+    # Adaptive DPI: pages that are essentially one embedded raster are rendered at no more
+    # than that image's native resolution (upsampling past it adds bytes, not detail)
+    ADAPTIVE_DPI = True
+    ADAPTIVE_DPI_MIN = 96  # Floor for the native-resolution cap
+    ADAPTIVE_DPI_MAX = DPI  # Ceiling, never render above this
+    ADAPTIVE_DPI_MIN_COVERAGE = 0.9  # Page fraction the dominant image must cover
+
+    # Image passthrough: a page that is one full-bleed embedded image keeps that image as
+    # stored (no render, no re-encode); the watermark is covered by a small patch tile
+    IMAGE_PASSTHROUGH = True
+    PASSTHROUGH_FORMATS = ["jpeg", "png"]
+    PASSTHROUGH_MAX_DPI_RATIO = 1.5  # Render instead if the image is this much sharper than needed
+
+    # Background encoder (see src/encoder.py): palette PNG for flat slides, JPEG/WebP otherwise
+    ENCODER_ADAPTIVE = True  # False = plain JPEG at the requested quality
+    ENCODER_JPEG_QUALITY = 80
+    ENCODER_MIN_QUALITY = 50  # Lowest quality the byte budget may push an image to
+    ENCODER_PALETTE_MAX_COLORS = 256
+    ENCODER_EDGE_THRESHOLD = 64  # Edge filter response that counts as a strong edge
+    ENCODER_SHARP_EDGE_DENSITY = 0.02  # From here on, keep full chroma (4:4:4) for crisp text and lines
+    ENCODER_WEBP_TARGETS = []  # Outputs that may use WebP, only "zip" can carry it
+    ENCODER_DOC_BUDGET_BYTES = {"pdf": 0, "pptx": 0}  # Background bytes per document, 0 = no limit
+    ENCODER_THREADS = 0  # 0 = cpu_count
+    ENCODER_DEDUP = True  # Encode identical backgrounds once, outputs share one image
+    ENCODER_DEDUP_ENTRIES = 32  # Recent distinct backgrounds remembered per document
+
+    # Page pipeline (see src/pipeline.py): render, then text extraction/OCR and encoding, then write
+    PIPELINE_WORKERS = 0  # Page threads, 0 = min(4, encoder threads)
+    PIPELINE_DEPTH = 0  # Pages in flight between render and write, 0 = 2 * PIPELINE_WORKERS
+
+    # Resolution pyramid: each page is rendered at the highest DPI asked for so far, lower DPIs are downsampled
+    PYRAMID_BASE_DPI = DPI  # Highest DPI a pyramid is built at
+    PYRAMID_MIN_DPI = 36  # Smallest level kept in a pyramid
+    RASTER_CACHE_MAX_BYTES = 512 * 1024 * 1024  # Shared by all documents in the process
+
+    # Watermark preview in app.py (see src/preview.py)
+    PREVIEW_WIDTH = 1000  # Pixels, previews are rendered once at this width
+    PREVIEW_MAX_DPI = 150
+    PREVIEW_CACHE_PAGES = 8  # Display-size page rasters kept per document
+
+    # OCR settings
+    OCR_DPI = 150  # Render resolution used for OCR input
+    # Pre-pass classifier: a page is "native", "mixed" or "needs_ocr"
+    OCR_MIN_SPANS = 5  # Fewer native spans than this means the page is mostly raster
+    OCR_MIN_IMAGE_COVERAGE = 0.05  # Fraction of page area covered by images before we probe them
+    OCR_PROBE_DPI = 50  # Low resolution render used for the text-likelihood check
+    OCR_TEXT_EDGE_DENSITY = 0.008  # Fraction of strong horizontal edges that looks like text
+    # Persistent OCR result cache (shared across sessions and restarts)
+    OCR_CACHE_ENABLED = True
+    OCR_CACHE_PATH = os.path.join(CACHE_DIR, 'ocr_cache.sqlite3')
+    OCR_CACHE_MAX_BYTES = 256 * 1024 * 1024
+    # OCR worker pool (one ONNX Runtime session per worker process)
+    OCR_WORKERS = 0  # 0 = cpu_count // OCR_INTRA_OP_THREADS, 1 = run OCR serially in-process
+    OCR_INTRA_OP_THREADS = 2  # Threads per session for a single operator
+    OCR_INTER_OP_THREADS = 1  # Threads per session for running operators in parallel
+
+    # Shared memory raster transport to worker processes (see src/shm.py)
+    SHM_TRANSPORT = True
+    SHM_MIN_BYTES = 1024 * 1024  # Smaller rasters are simply pickled
+    SHM_PREFIX = "nle"  # Segment name prefix, also used to find stale segments
+
+    # Layout reconstruction: merge spans into lines (PDF) and paragraphs (PPTX)
+    LAYOUT_GROUPING = True
+    LAYOUT_MAX_WORD_GAP = 1.0  # Largest x-gap between spans of one line, in font sizes
+    LAYOUT_MAX_LINE_GAP = 0.8  # Largest vertical gap between lines of one paragraph, in font sizes
+
+    # Startup budget checked by bench_startup.py
+    STARTUP_IMPORT_BUDGET_MS = 400  # Best-of-N wall time for "import src.processor"
+    # Heavy dependencies that must only be imported on first use
+    STARTUP_DEFERRED_MODULES = ["pptx", "numpy", "opencc", "rapidocr_onnxruntime", "gspread", "oauth2client"]
+
+    # Settings that change the pages a conversion job checkpoints; they are part of the
+    # checkpoint key (see PDFProcessor._open_checkpoint), so changing one starts jobs afresh
+    CHECKPOINT_KEY_SETTINGS = [
+        "DPI", "PPTX_DPI", "RENDER_BAND_THRESHOLD_PIXELS", "RENDER_BAND_HEIGHT",
+        "ADAPTIVE_DPI", "ADAPTIVE_DPI_MIN", "ADAPTIVE_DPI_MAX", "ADAPTIVE_DPI_MIN_COVERAGE",
+        "IMAGE_PASSTHROUGH", "PASSTHROUGH_FORMATS", "PASSTHROUGH_MAX_DPI_RATIO",
+        "ENCODER_ADAPTIVE", "ENCODER_JPEG_QUALITY", "ENCODER_MIN_QUALITY", "ENCODER_PALETTE_MAX_COLORS",
+        "ENCODER_EDGE_THRESHOLD", "ENCODER_SHARP_EDGE_DENSITY", "ENCODER_WEBP_TARGETS", "ENCODER_DOC_BUDGET_BYTES",
+        "PYRAMID_BASE_DPI", "PYRAMID_MIN_DPI",
+        "DEFAULT_FONT_PATH", "SYSTEM_FONT_FALLBACK", "CJK_FONT_FALLBACK", "FONT_SUBSET",
+        "OCR_DPI", "OCR_MIN_SPANS", "OCR_MIN_IMAGE_COVERAGE", "OCR_PROBE_DPI", "OCR_TEXT_EDGE_DENSITY",
+        "LAYOUT_GROUPING", "LAYOUT_MAX_WORD_GAP", "LAYOUT_MAX_LINE_GAP",
+        "TEXT_CORRECTIONS", "OPENCC_IGNORE_CHARS"
+    ]
+
+    # Job scheduler (shared by all Streamlit sessions in the process)
+    MAX_CONCURRENT_JOBS = 2
+    JOB_MEMORY_BUDGET_BYTES = 2 * 1024 * 1024 * 1024
+    JOB_AGING_SECONDS = 60  # A queued job's effective cost halves after waiting this long
+    BACKGROUND_MAX_JOBS = 1  # Workers speculative (background priority) jobs may occupy
+
+    # Speculative warm-up started on upload (see PDFProcessor.warm_caches)
+    WARMUP_ON_UPLOAD = True
+    WARMUP_OCR = True  # Also OCR the pages that need it, the results go to the OCR cache
+
+    # Headless job service (see service.py)
+    SERVICE_HOST = "127.0.0.1"
+    SERVICE_PORT = 8765
+    SERVICE_MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+    SERVICE_JOB_RETENTION_SECONDS = 60 * 60  # Finished jobs are forgotten after this long
+
+    # Workspaces (see src/workspace.py)
+    WORKSPACE_QUOTA_BYTES = 5 * 1024 * 1024 * 1024
+    WORKSPACE_TTL_SECONDS = 24 * 60 * 60  # Unused workspaces older than this are always removed
+    WORKSPACE_GRACE_SECONDS = 15 * 60  # Workspaces used more recently than this are never removed
+    WORKSPACE_EVICT_INTERVAL = 60  # Minimum seconds between eviction scans
 
     # Watermark settings (NotebookLM usually puts it in bottom right)
     # These are relative coordinates (0.0 to 1.0) or absolute points?
@@ -0,0 +1,152 @@
+import contextlib
+import threading
+import time
+
+import fitz  # PyMuPDF
+
+from .config import Config
+
+# PyMuPDF runs every document on one global MuPDF context, so even separate
+# handles must not be parsed, rendered or closed by two threads at once.
+# Code that calls MuPDF from several threads holds this lock around it.
+mupdf_lock = threading.RLock()
+
+class DocumentPool:
+    """
+    Pool of PyMuPDF handles on one source document.
+    A fitz.Document must not be used by two threads at once, so page tasks
+    borrow a handle (see lend) instead of sharing one. MuPDF calls on it are
+    still made under mupdf_lock, so a second handle adds memory but no
+    concurrency; that is why Config.DOC_POOL_MAX_HANDLES defaults to one.
+    Borrowers only hold a handle for their MuPDF calls. Handles are opened
+    on demand up to max_handles, reused afterwards, and closed again once
+    they have been idle for idle_seconds.
+    source: path of the PDF, or its bytes.
+    """
+
+    def __init__(self, source, max_handles=None, idle_seconds=None):
+        self.max_handles = max_handles or Config.DOC_POOL_MAX_HANDLES
+        self.idle_seconds = idle_seconds or Config.DOC_POOL_IDLE_SECONDS
+        self.source = source
+
+        self._idle = [] # (doc, returned_at), most recently returned last
+        self._open_count = 0
+        self._closed = False
+        self._local = threading.local() # Handle lent to the current thread, see lend
+        self._cond = threading.Condition()
+        self._reaper = None
+
+    def open(self):
+        """
+        Opens a private handle on the source bytes, for work that modifies the
+        document (e.g. redactions). The caller closes it; it is not pooled.
+        """
+        with mupdf_lock:
+            if isinstance(self.source, (bytes, bytearray)):
+                return fitz.open(stream=self.source, filetype="pdf")
+            return fitz.open(self.source)
+
+    @contextlib.contextmanager
+    def lend(self):
+        """
+        Borrows a handle for the duration of a with block:
+            with pool.lend() as doc:
+                pix = doc[page_num].get_pixmap(dpi=dpi)
+        Blocks while all max_handles handles are lent out. Nested calls on the
+        same thread get the handle that thread already holds. Don't keep pages
+        or other objects of the handle beyond the block, and don't modify it.
+        """
+        held = getattr(self._local, "doc", None)
+        if held is not None:
+            yield held
+            return
+
+        doc = self._acquire()
+        self._local.doc = doc
+        try:
+            yield doc
+        finally:
+            self._local.doc = None
+            self._release(doc)
+
+    def _acquire(self):
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Document pool is closed")
+                if self._idle:
+                    return self._idle.pop()[0]
+                if self._open_count < self.max_handles:
+                    self._open_count += 1
+                    break
+                self._cond.wait()
+
+        # Parse outside the lock, other threads can keep borrowing meanwhile
+        try:
+            return self.open()
+        except Exception:
+            with self._cond:
+                self._open_count -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, doc):
+        with self._cond:
+            closed = self._closed
+            if closed:
+                self._open_count -= 1
+            else:
+                self._idle.append((doc, time.monotonic()))
+                self._cond.notify()
+                if self._reaper is None:
+                    self._reaper = threading.Thread(target=self._reap_loop, name="docpool-reaper", daemon=True)
+                    self._reaper.start()
+        if closed:
+            with mupdf_lock:
+                doc.close()
+
+    def close_idle(self, max_idle=None):
+        """
+        Closes handles that have been idle for more than max_idle seconds
+        (idle_seconds by default). Returns the number closed.
+        """
+        max_idle = self.idle_seconds if max_idle is None else max_idle
+        now = time.monotonic()
+        with self._cond:
+            stale = [doc for doc, returned_at in self._idle if now - returned_at >= max_idle]
+            self._idle = [(doc, returned_at) for doc, returned_at in self._idle if now - returned_at < max_idle]
+            self._open_count -= len(stale)
+            self._cond.notify_all()
+        with mupdf_lock:
+            for doc in stale:
+                doc.close()
+        return len(stale)
+
+    def _reap_loop(self):
+        # Runs while handles sit idle, exits once none are left so the pool can be freed
+        while True:
+            with self._cond:
+                if self._closed or not self._idle:
+                    self._reaper = None
+                    return
+                oldest = self._idle[0][1]
+            time.sleep(max(0.0, oldest + self.idle_seconds - time.monotonic()) + 0.1)
+            self.close_idle()
+
+    def stats(self):
+        with self._cond:
+            return {"open": self._open_count, "idle": len(self._idle), "max": self.max_handles}
+
+    def close(self):
+        """
+        Closes all idle handles; handles still lent out are closed when returned.
+        """
+        with self._cond:
+            self._closed = True
+            idle = [doc for doc, _ in self._idle]
+            self._idle = []
+            self._open_count -= len(idle)
+            self._cond.notify_all()
+        with mupdf_lock:
+            for doc in idle:
+                doc.close()
@@ -0,0 +1,199 @@
+import collections
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageFilter
+
+from .config import Config
+
+# Formats each output can carry without the writer transcoding them
+# (PyMuPDF would turn WebP into a Flate image, python-pptx rejects it)
+_TARGET_FORMATS = {
+    "pdf": ("png", "jpg"),
+    "pptx": ("png", "jpg"),
+    "zip": ("png", "jpg", "webp")
+}
+
+
+def analyze_image(img):
+    """
+    Looks at a background before encoding it.
+    Returns (colors, edge_density): the exact palette as returned by getcolors
+    (None if it has more than ENCODER_PALETTE_MAX_COLORS colors) and the fraction
+    of strong edge pixels on a reduced grayscale copy.
+    """
+    colors = img.getcolors(Config.ENCODER_PALETTE_MAX_COLORS)
+
+    gray = img.convert("L")
+    factor = max(1, max(gray.size) // 512)
+    if factor > 1:
+        gray = gray.reduce(factor)
+    hist = gray.filter(ImageFilter.FIND_EDGES).histogram()
+    edge_density = sum(hist[Config.ENCODER_EDGE_THRESHOLD:]) / max(1, gray.width * gray.height)
+    return colors, edge_density
+
+
+def _encode_palette(img, colors):
+    # The palette holds every color of the image, so the PNG is lossless
+    palette = [channel for _, color in colors for channel in color[:3]]
+    palette_img = Image.new("P", (1, 1))
+    palette_img.putpalette(palette + palette[:3] * (256 - len(colors)))
+    buf = io.BytesIO()
+    img.quantize(palette=palette_img, dither=Image.Dither.NONE).save(buf, "PNG", optimize=True)
+    return buf.getvalue()
+
+
+def _encode_lossy(img, fmt, quality, subsampling):
+    buf = io.BytesIO()
+    if fmt == "webp":
+        img.save(buf, "WEBP", quality=quality, method=4)
+    else:
+        img.save(buf, "JPEG", quality=quality, subsampling=subsampling, optimize=True)
+    return buf.getvalue()
+
+
+class BackgroundEncoder:
+    """
+    Content-adaptive encoder for the background images of one output document.
+    Flat slides with few colors become lossless palette PNGs; everything else is
+    JPEG (or WebP where the target allows it), keeping full chroma resolution for
+    sharp text and line art and subsampling it for photos. With a byte budget
+    the lossy settings are lowered per image until its share of the budget fits.
+    Images are encoded on the shared encode thread pool (see submit); a raster
+    identical to a recent one (a shared template backdrop) is encoded only once.
+    """
+
+    def __init__(self, target, quality=None, budget_bytes=None, total_pixels=None):
+        self.target = target
+        self.formats = [fmt for fmt in _TARGET_FORMATS.get(target, ("jpg",)) if fmt != "webp" or target in Config.ENCODER_WEBP_TARGETS]
+        self.quality = quality or Config.ENCODER_JPEG_QUALITY
+        if budget_bytes is None:
+            budget_bytes = Config.ENCODER_DOC_BUDGET_BYTES.get(target, 0)
+        # Budget per pixel, so each image gets the share of its area
+        self.bytes_per_pixel = budget_bytes / total_pixels if budget_bytes and total_pixels else None
+
+        self.counts = {}
+        self.total_bytes = 0
+        self.reused = 0
+        self._recent = collections.OrderedDict() # raster hash -> Future, most recent last
+        self._lock = threading.Lock()
+
+    def encode(self, img):
+        """
+        Encodes img. Returns (image_bytes, ext) with ext "png", "jpg" or "webp".
+        """
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        if not Config.ENCODER_ADAPTIVE:
+            data, ext = _encode_lossy(img, "jpg", self.quality, 2), "jpg"
+        else:
+            data, ext = self._encode_adaptive(img)
+
+        with self._lock:
+            self.counts[ext] = self.counts.get(ext, 0) + 1
+            self.total_bytes += len(data)
+        return data, ext
+
+    def _encode_adaptive(self, img):
+        budget = img.width * img.height * self.bytes_per_pixel if self.bytes_per_pixel else None
+        colors, edge_density = analyze_image(img)
+
+        # 1. Few colors: lossless palette PNG, unless a lossy encode is needed to fit the budget
+        palette_data = None
+        if colors is not None and "png" in self.formats:
+            palette_data = _encode_palette(img, colors)
+            if budget is None or len(palette_data) <= budget:
+                return palette_data, "png"
+
+        # 2. Lossy: full chroma for sharp content, then subsampled chroma, then lower quality
+        fmt = "webp" if "webp" in self.formats else "jpg"
+        sharp = edge_density >= Config.ENCODER_SHARP_EDGE_DENSITY
+        subsampling = 0 if sharp and fmt == "jpg" else 2
+        quality = self.quality
+        data = _encode_lossy(img, fmt, quality, subsampling)
+        while budget is not None and len(data) > budget:
+            if subsampling == 0:
+                subsampling = 2
+            elif quality - 10 >= Config.ENCODER_MIN_QUALITY:
+                quality -= 10
+            else:
+                break
+            data = _encode_lossy(img, fmt, quality, subsampling)
+
+        if palette_data is not None and len(palette_data) <= len(data):
+            return palette_data, "png"
+        return data, fmt
+
+    def submit(self, img):
+        """
+        Encodes img on the shared encode thread pool (Pillow releases the GIL
+        while encoding). Returns a Future of (image_bytes, ext); identical
+        rasters get the same Future, so their bytes are identical too.
+        """
+        if not Config.ENCODER_DEDUP:
+            return get_encode_executor().submit(self.encode, img)
+
+        h = hashlib.sha256()
+        h.update(f"{img.mode}{img.size}".encode("ascii"))
+        h.update(img.tobytes())
+        key = h.hexdigest()
+        with self._lock:
+            future = self._recent.get(key)
+            if future is not None:
+                self._recent.move_to_end(key)
+                self.reused += 1
+                return future
+            future = get_encode_executor().submit(self.encode, img)
+            self._recent[key] = future
+            while len(self._recent) > Config.ENCODER_DEDUP_ENTRIES:
+                self._recent.popitem(last=False)
+            return future
+
+    def report(self):
+        """
+        Prints how many images were written in each format and their total size.
+        """
+        if not self.counts:
+            return
+        formats = ", ".join(f"{count} {ext.upper()}" for ext, count in sorted(self.counts.items()))
+        reused = f", {self.reused} duplicate(s) reused" if self.reused else ""
+        print(f"Background images ({self.target}): {formats}, {self.total_bytes / (1024 * 1024):.1f} MB{reused}")
+
+
+def resolve_tiles(tiles):
+    """
+    Waits for tiles whose image is still being encoded.
+    tiles: list of (image_bytes, ext, rect) or (Future, None, rect).
+    Returns a list of (image_bytes, ext, rect).
+    """
+    resolved = []
+    for image, ext, rect in tiles:
+        if ext is None:
+            image, ext = image.result()
+        resolved.append((image, ext, rect))
+    return resolved
+
+
+def encode_workers():
+    """
+    Number of threads in the shared encode pool.
+    """
+    return Config.ENCODER_THREADS or max(1, os.cpu_count() or 1)
+
+
+_encode_executor = None
+_encode_executor_lock = threading.Lock()
+
+
+def get_encode_executor():
+    """
+    Returns the process-wide thread pool used for background encoding.
+    """
+    global _encode_executor
+    with _encode_executor_lock:
+        if _encode_executor is None:
+            _encode_executor = ThreadPoolExecutor(max_workers=encode_workers(), thread_name_prefix="encode")
+        return _encode_executor
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job when its CancelToken has been triggered.
+    """
+
+
+class CancelToken:
+    """
+    Cooperative cancellation flag, checked by long-running jobs between pages.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise JobCancelled()
+
+
+def make_job_id(*parts):
+    """
+    Deterministic job id from JSON-serialisable parts (document hash, job kind, settings).
+    The same document with the same settings always maps to the same job directory.
+    """
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+
+def _atomic_write(path, data):
+    tmp_path = f"{path}.tmp{os.getpid()}_{threading.get_ident()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+# Owner tokens of the checkpoint directories this process holds, see JobCheckpoint.acquire
+_held_tokens = set()
+_held_tokens_lock = threading.Lock()
+
+
+def _pid_alive(pid):
+    if os.name == "nt":
+        return True # os.kill would terminate it, assume alive; eviction clears old locks
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobCheckpoint:
+    """
+    Page-level checkpoints for a conversion job, stored in the job's directory.
+    Each finished page is one or more encoded background tiles plus a JSON file
+    with its text elements. The JSON is written last, so it marks the page done.
+    A running job owns its directory exclusively (see acquire), so a second job
+    with the same id can't remove the pages the first one is still using.
+    """
+
+    # Part of the job id, bump when the on-disk format changes
+    VERSION = 2
+    LOCK_NAME = "owner.lock"
+
+    def __init__(self, job_dir):
+        self.job_dir = job_dir
+        os.makedirs(self.job_dir, exist_ok=True)
+        self._token = None
+
+    def acquire(self):
+        """
+        Takes exclusive ownership of the directory through a lock file holding
+        the owner's pid. Returns False if another live job holds it; a lock left
+        by a process that died (or a job that never released it) is taken over.
+        """
+        path = os.path.join(self.job_dir, self.LOCK_NAME)
+        token = f"{os.getpid()}:{uuid.uuid4().hex}"
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._lock_is_stale(path):
+                    return False
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(token)
+            with _held_tokens_lock:
+                _held_tokens.add(token)
+            self._token = token
+            return True
+        return False
+
+    def _lock_is_stale(self, path):
+        try:
+            with open(path, "r") as f:
+                token = f.read()
+            pid = int(token.split(":", 1)[0])
+        except FileNotFoundError:
+            return True
+        except ValueError:
+            return False # Still being written
+        if pid == os.getpid():
+            with _held_tokens_lock:
+                return token not in _held_tokens
+        return not _pid_alive(pid)
+
+    def release(self):
+        """
+        Gives up ownership, keeping the pages so a later run can resume.
+        """
+        if self._token is None:
+            return
+        with _held_tokens_lock:
+            _held_tokens.discard(self._token)
+        try:
+            os.remove(os.path.join(self.job_dir, self.LOCK_NAME))
+        except FileNotFoundError:
+            pass
+        self._token = None
+
+    def _data_path(self, page_num):
+        return os.path.join(self.job_dir, f"page_{page_num:05d}.json")
+
+    def has_page(self, page_num):
+        return os.path.exists(self._data_path(page_num))
+
+    def save_page(self, page_num, tiles, data):
+        """
+        Stores a finished page.
+        tiles: list of (image_bytes, image_ext, rect); rect is the tile position in
+        page coordinates, or None for a single full-page image.
+        data must be JSON serialisable.
+        """
+        tile_refs = []
+        for i, (image_bytes, image_ext, rect) in enumerate(tiles):
+            image_name = f"page_{page_num:05d}_{i}.{image_ext}"
+            _atomic_write(os.path.join(self.job_dir, image_name), image_bytes)
+            tile_refs.append({"image": image_name, "rect": list(rect) if rect is not None else None})
+        data = dict(data, tiles=tile_refs)
+        _atomic_write(self._data_path(page_num), json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+    def load_page(self, page_num):
+        """
+        Returns (tiles, data) for a checkpointed page; tiles are (image_bytes, rect) pairs.
+        """
+        with open(self._data_path(page_num), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        tiles = []
+        for tile in data["tiles"]:
+            with open(os.path.join(self.job_dir, tile["image"]), "rb") as f:
+                tiles.append((f.read(), tile["rect"]))
+        return tiles, data
+
+    def remove(self):
+        """
+        Deletes the checkpoints of a finished job, only call it while owning the directory.
+        """
+        shutil.rmtree(self.job_dir, ignore_errors=True)
+        if self._token is not None:
+            with _held_tokens_lock:
+                _held_tokens.discard(self._token)
+            self._token = None
@@ -0,0 +1,154 @@
+import itertools
+from collections import defaultdict
+
+from .config import Config
+
+
+class _GridIndex:
+    """
+    Uniform grid over page coordinates. Items are stored at an anchor point and
+    found again by looking at the 3x3 cells around a query point, so lookups
+    stay constant time as long as the search radius is at most one cell.
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = max(cell_size, 1.0)
+        self.cells = defaultdict(list)
+
+    def _key(self, x, y):
+        return (int(x // self.cell_size), int(y // self.cell_size))
+
+    def add(self, x, y, item):
+        self.cells[self._key(x, y)].append(item)
+
+    def remove(self, x, y, item):
+        self.cells[self._key(x, y)].remove(item)
+
+    def near(self, x, y):
+        cx, cy = self._key(x, y)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                yield from self.cells.get((cx + dx, cy + dy), ())
+
+
+def _is_cjk(char):
+    return ord(char) >= 0x2E80
+
+
+def _same_style(a, b):
+    return a["color"] == b["color"] and abs(a["size"] - b["size"]) <= max(0.5, 0.1 * a["size"])
+
+
+def _union(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def group_lines(elements):
+    """
+    Merges text spans that share a baseline, font size and color and are
+    separated by a small x-gap into single line elements.
+    Returns new element dicts (text, bbox, size, color, origin).
+    """
+    if not elements:
+        return elements
+
+    max_size = max(elem["size"] for elem in elements)
+    index = _GridIndex(max_size * Config.LAYOUT_MAX_WORD_GAP)
+    lines = []
+
+    # Left to right, so an open line's end only moves right
+    for elem in sorted(elements, key=lambda e: (e["bbox"][0], e["origin"][1])):
+        size = elem["size"]
+        x0 = elem["bbox"][0]
+        baseline = elem["origin"][1]
+
+        best = None
+        best_gap = None
+        for line in index.near(x0, baseline):
+            if abs(line["origin"][1] - baseline) > 0.2 * size or not _same_style(line, elem):
+                continue
+            gap = x0 - line["bbox"][2]
+            if -0.5 * size <= gap <= Config.LAYOUT_MAX_WORD_GAP * size and (best is None or abs(gap) < abs(best_gap)):
+                best, best_gap = line, gap
+
+        if best is None:
+            line = dict(elem)
+            lines.append(line)
+            index.add(line["bbox"][2], baseline, line)
+            continue
+
+        index.remove(best["bbox"][2], best["origin"][1], best)
+        text = elem["text"]
+        # Spans are stripped on extraction, restore the word space for non-CJK text
+        if best_gap > 0.15 * size and not (_is_cjk(best["text"][-1]) or _is_cjk(text[0])):
+            text = " " + text
+        best["text"] += text
+        best["bbox"] = _union(best["bbox"], elem["bbox"])
+        index.add(best["bbox"][2], best["origin"][1], best)
+
+    # Restore reading order (top to bottom, left to right)
+    lines.sort(key=lambda e: (e["origin"][1], e["bbox"][0]))
+    return lines
+
+
+def group_paragraphs(lines):
+    """
+    Merges consecutive lines with the same style and left (or center)
+    alignment and a normal line gap into paragraphs. Paragraph text keeps
+    one line per "\n".
+    """
+    if not lines:
+        return lines
+
+    max_size = max(line["size"] for line in lines)
+    # Paragraphs are indexed at their last line's bottom edge twice, by its left edge and
+    # by its centre, so centred lines of any width find the paragraph above them
+    by_left = _GridIndex(max_size * 1.5)
+    by_center = _GridIndex(max_size * 1.5)
+
+    def add(para):
+        last = para["_last_bbox"]
+        by_left.add(last[0], last[3], para)
+        by_center.add((last[0] + last[2]) / 2, last[3], para)
+
+    def remove(para):
+        last = para["_last_bbox"]
+        by_left.remove(last[0], last[3], para)
+        by_center.remove((last[0] + last[2]) / 2, last[3], para)
+
+    paragraphs = []
+
+    for line in sorted(lines, key=lambda e: (e["bbox"][1], e["bbox"][0])):
+        size = line["size"]
+        x0, y0, x1, _ = line["bbox"]
+
+        best = None
+        for para in itertools.chain(by_left.near(x0, y0), by_center.near((x0 + x1) / 2, y0)):
+            if not _same_style(para, line):
+                continue
+            gap = y0 - para["_last_bbox"][3]
+            if not (-0.3 * size <= gap <= Config.LAYOUT_MAX_LINE_GAP * size):
+                continue
+            last = para["_last_bbox"]
+            left_aligned = abs(last[0] - x0) <= 0.5 * size
+            center_aligned = abs((last[0] + last[2]) / 2 - (x0 + x1) / 2) <= 0.5 * size
+            if left_aligned or center_aligned:
+                best = para
+                break
+
+        if best is None:
+            para = dict(line, _last_bbox=line["bbox"])
+            paragraphs.append(para)
+            add(para)
+            continue
+
+        remove(best)
+        best["text"] += "\n" + line["text"]
+        best["bbox"] = _union(best["bbox"], line["bbox"])
+        best["_last_bbox"] = line["bbox"]
+        add(best)
+
+    for para in paragraphs:
+        del para["_last_bbox"]
+    paragraphs.sort(key=lambda e: (e["bbox"][1], e["bbox"][0]))
+    return paragraphs
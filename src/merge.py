@@ -0,0 +1,140 @@
+import copy
+import io
+import os
+import re
+
+import fitz
+
+from .docpool import mupdf_lock
+
+# Suffix written by PDFProcessor._select_pages for page-range fragments
+_FRAGMENT_SUFFIX = re.compile(r"_p(\d+)-(\d+)\.\w+$")
+
+
+def parse_page_ranges(spec, page_count):
+    """
+    Parses a 1-based page range spec like "1-40,45,50-" into a sorted list of
+    0-based page numbers. An open range ("50-") runs to the last page.
+    Raises ValueError on malformed or out-of-range input.
+    """
+    pages = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            start = int(start) if start.strip() else 1
+            end = int(end) if end.strip() else page_count
+        else:
+            start = end = int(part)
+        if start < 1 or end > page_count or start > end:
+            raise ValueError(f"Invalid page range '{part}' (document has {page_count} pages)")
+        pages.update(range(start - 1, end))
+    if not pages:
+        raise ValueError("Empty page range")
+    return sorted(pages)
+
+
+def order_fragments(paths):
+    """
+    Sorts fragment files by the first page in their "_pA-B" suffix.
+    Paths without the suffix keep the order they were given in.
+    """
+    def first_page(path):
+        match = _FRAGMENT_SUFFIX.search(os.path.basename(path))
+        return int(match.group(1)) if match else 0
+
+    if all(_FRAGMENT_SUFFIX.search(os.path.basename(path)) for path in paths):
+        return sorted(paths, key=first_page)
+    return list(paths)
+
+
+def merge_pdfs(paths, output_path):
+    """
+    Concatenates PDF fragments in the given order.
+    """
+    with mupdf_lock:
+        merged = fitz.open()
+        for path in paths:
+            with fitz.open(path) as part:
+                merged.insert_pdf(part)
+        # garbage=3 folds byte-identical objects (e.g. a background shared across fragments).
+        # Fonts stay one subset per fragment: each subset holds different glyphs, so none are identical
+        merged.save(output_path, garbage=3, deflate=True)
+        merged.close()
+    print(f"Merged {len(paths)} PDF fragments into: {output_path}")
+    return output_path
+
+
+def merge_pptx(paths, output_path):
+    """
+    Concatenates PPTX fragments in the given order.
+    python-pptx can't import slides, so each slide's shape tree is copied onto
+    a new blank slide and its pictures are re-added to the merged package
+    (identical images end up as one shared media part).
+    """
+    from pptx import Presentation
+    from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+    from pptx.oxml.ns import qn
+
+    merged = Presentation(paths[0])
+    blank_layout = merged.slide_layouts[6]
+    rel_attrs = (qn("r:embed"), qn("r:link"), qn("r:id"))
+
+    for path in paths[1:]:
+        part_prs = Presentation(path)
+        if (part_prs.slide_width, part_prs.slide_height) != (merged.slide_width, merged.slide_height):
+            print(f"Warning: {path} has a different slide size, slides may be scaled.")
+
+        for src_slide in part_prs.slides:
+            slide = merged.slides.add_slide(blank_layout)
+
+            # 1. Pictures: re-add the image parts and remember the new relationship ids
+            rid_map = {}
+            for rel in src_slide.part.rels.values():
+                if rel.reltype == RT.IMAGE:
+                    _, new_rid = slide.part.get_or_add_image_part(io.BytesIO(rel.target_part.blob))
+                    rid_map[rel.rId] = new_rid
+                elif rel.reltype not in (RT.SLIDE_LAYOUT, RT.NOTES_SLIDE):
+                    print(f"Warning: skipping unsupported slide relationship {rel.reltype}")
+
+            # 2. Shapes: copy them, pointing image references at the new ids
+            sp_tree = slide.shapes._spTree
+            ext_lst = sp_tree.find(qn("p:extLst"))
+            for elem in src_slide.shapes._spTree.iterchildren():
+                if elem.tag in (qn("p:nvGrpSpPr"), qn("p:grpSpPr"), qn("p:extLst")):
+                    continue
+                new_elem = copy.deepcopy(elem)
+                for node in new_elem.iter():
+                    for attr in rel_attrs:
+                        if node.get(attr) in rid_map:
+                            node.set(attr, rid_map[node.get(attr)])
+                if ext_lst is None:
+                    sp_tree.append(new_elem)
+                else:
+                    ext_lst.addprevious(new_elem)
+
+            # 3. Speaker notes
+            if src_slide.has_notes_slide:
+                slide.notes_slide.notes_text_frame.text = src_slide.notes_slide.notes_text_frame.text
+
+    merged.save(output_path)
+    print(f"Merged {len(paths)} PPTX fragments into: {output_path}")
+    return output_path
+
+
+def merge_fragments(paths, output_path):
+    """
+    Merges PDF or PPTX fragments (chosen by extension) into output_path.
+    Fragments named with a page-range suffix are put in page order first.
+    """
+    if not paths:
+        raise ValueError("No fragments to merge")
+    paths = order_fragments(paths)
+    extensions = {os.path.splitext(path)[1].lower() for path in paths}
+    if extensions == {".pdf"}:
+        return merge_pdfs(paths, output_path)
+    if extensions == {".pptx"}:
+        return merge_pptx(paths, output_path)
+    raise ValueError("Fragments must all be PDF or all be PPTX")
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .config import Config
+
+
+def normalize_result(result):
+    """
+    Converts a RapidOCR result (numpy boxes and scores, or None) to plain
+    lists and floats, so it is JSON serialisable (cache, job checkpoints).
+    """
+    return [
+        [[[float(x), float(y)] for x, y in dt_box], str(text), float(score)]
+        for dt_box, text, score in (result or [])
+    ]
+
+
+class OCRCache:
+    """
+    Persistent OCR result cache shared across sessions, processes and restarts.
+    Results are keyed by a hash of the page raster plus the OCR config, so a
+    re-uploaded (or colleague's) deck never goes through the OCR model twice.
+    """
+
+    def __init__(self, path=None, max_bytes=None):
+        self.path = path or Config.OCR_CACHE_PATH
+        self.max_bytes = max_bytes or Config.OCR_CACHE_MAX_BYTES
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        # sqlite3 connections can't be shared between threads, keep one per thread
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_results ("
+            " key TEXT PRIMARY KEY,"
+            " result TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_ocr_last_access ON ocr_results (last_access)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: autocommit, transactions are opened explicitly in put()
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            # WAL lets readers run concurrently with a writer
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(img, ocr_config):
+        """
+        Builds the cache key from a numpy raster and a dict describing the OCR setup.
+        """
+        h = hashlib.sha256()
+        h.update(json.dumps(ocr_config, sort_keys=True).encode("utf-8"))
+        h.update(str(img.shape).encode("ascii"))
+        h.update(img if img.flags["C_CONTIGUOUS"] else img.tobytes())
+        return h.hexdigest()
+
+    def get(self, key):
+        """
+        Returns the cached OCR result for key, or None on a miss.
+        """
+        try:
+            conn = self._connect()
+            row = conn.execute("SELECT result FROM ocr_results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            # Refresh LRU timestamp (best effort, a busy writer shouldn't fail the read)
+            try:
+                conn.execute("UPDATE ocr_results SET last_access = ? WHERE key = ?", (time.time(), key))
+            except sqlite3.OperationalError:
+                pass
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            print(f"OCR cache read error: {e}")
+            return None
+
+    def put(self, key, result):
+        """
+        Stores an OCR result atomically and evicts old entries above the size limit.
+        result: RapidOCR output, a list of [dt_box, text, score] (or None).
+        """
+        normalized = normalize_result(result)
+        payload = json.dumps(normalized, ensure_ascii=False)
+
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO ocr_results (key, result, size, last_access) VALUES (?, ?, ?, ?)",
+                    (key, payload, len(payload), time.time())
+                )
+                self._evict(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            print(f"OCR cache write error: {e}")
+        return normalized
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Drop least recently used entries until we are back under 90% of the limit
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        stale_keys = []
+        for key, size in conn.execute("SELECT key, size FROM ocr_results ORDER BY last_access"):
+            stale_keys.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        conn.executemany("DELETE FROM ocr_results WHERE key = ?", stale_keys)
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_ocr_cache():
+    """
+    Returns the process-wide OCRCache instance, or None if caching is disabled.
+    """
+    global _shared_cache
+    if not Config.OCR_CACHE_ENABLED:
+        return None
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = OCRCache()
+        return _shared_cache
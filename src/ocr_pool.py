@@ -0,0 +1,180 @@
+import atexit
+import collections
+import importlib
+import multiprocessing as mp
+import os
+import threading
+from multiprocessing import resource_tracker
+
+from .config import Config
+from .shm import RasterRef, SharedRaster, sweep_stale_segments
+
+
+def create_ocr_engine(intra_op_threads=None, inter_op_threads=None):
+    """
+    Creates a RapidOCR instance with bounded ONNX Runtime thread pools.
+    """
+    from rapidocr_onnxruntime import RapidOCR
+
+    intra = Config.OCR_INTRA_OP_THREADS if intra_op_threads is None else intra_op_threads
+    inter = Config.OCR_INTER_OP_THREADS if inter_op_threads is None else inter_op_threads
+    try:
+        return RapidOCR(intra_op_num_threads=intra, inter_op_num_threads=inter)
+    except TypeError:
+        # Older rapidocr_onnxruntime releases don't expose the session options
+        return RapidOCR()
+
+
+# Per-process engine inside pool workers
+_worker_ocr = None
+
+
+def _init_worker(intra_op_threads, inter_op_threads):
+    global _worker_ocr
+    _worker_ocr = create_ocr_engine(intra_op_threads, inter_op_threads)
+
+
+def _run_task(task):
+    key, img = task
+    if not isinstance(img, RasterRef):
+        result, elapse = _worker_ocr(img)
+        return key, result
+
+    # Shared memory raster: read it in place, the parent unlinks it
+    segment, img = img.attach()
+    try:
+        result, elapse = _worker_ocr(img)
+    finally:
+        del img
+        segment.close()
+    return key, result
+
+
+class OCRWorkerPool:
+    """
+    Pool of OCR worker processes, each owning its own ONNX Runtime session.
+    Workers pull pages from the pool's shared task queue; the number of
+    in-flight pages is bounded so rasters don't pile up in memory.
+    """
+
+    def __init__(self, workers=None, intra_op_threads=None, inter_op_threads=None):
+        self.intra_op_threads = intra_op_threads or Config.OCR_INTRA_OP_THREADS
+        self.inter_op_threads = inter_op_threads or Config.OCR_INTER_OP_THREADS
+        # Default: fill the machine with workers without oversubscribing it
+        self.workers = workers or Config.OCR_WORKERS or max(1, (os.cpu_count() or 1) // self.intra_op_threads)
+
+        # Fail here, in the caller, if the OCR runtime is missing
+        importlib.import_module("rapidocr_onnxruntime")
+
+        # Workers must share the parent's resource tracker, or each would start its
+        # own and report the shared rasters it attached to as leaked on exit
+        if Config.SHM_TRANSPORT:
+            sweep_stale_segments()
+            resource_tracker.ensure_running()
+
+        # The pool is started lazily from job threads, and forking a threaded process
+        # can leave the children stuck on locks other threads held (logging, imports,
+        # ONNX Runtime). Workers are forked from a single-threaded fork server instead,
+        # which imports the OCR runtime once so they share it copy-on-write. Sessions
+        # are still created per worker.
+        if "forkserver" in mp.get_all_start_methods():
+            ctx = mp.get_context("forkserver")
+            ctx.set_forkserver_preload(["rapidocr_onnxruntime"])
+        else:
+            ctx = mp.get_context("spawn")
+        self._pool = ctx.Pool(
+            self.workers,
+            initializer=_init_worker,
+            initargs=(self.intra_op_threads, self.inter_op_threads)
+        )
+
+    def run(self, tasks):
+        """
+        OCRs (key, numpy_image) tasks across the workers.
+        Yields (key, result) in submission order.
+        Large rasters travel through shared memory (see src/shm.py) instead of
+        being pickled through the pool's pipes.
+        """
+        window = self.workers * 2
+        pending = collections.deque() # (AsyncResult, SharedRaster or None)
+        try:
+            for key, img in tasks:
+                raster = None
+                if Config.SHM_TRANSPORT and img.nbytes >= Config.SHM_MIN_BYTES:
+                    # Owned by this run, released once the task's result is in
+                    raster = SharedRaster.from_array(img)
+                    img = raster.ref
+                pending.append((self._pool.apply_async(_run_task, ((key, img),)), raster))
+                if len(pending) >= window:
+                    yield self._result(pending.popleft())
+            while pending:
+                yield self._result(pending.popleft())
+        finally:
+            # Abandoned or failed run: the workers may still read the rasters, wait for them
+            for async_result, raster in pending:
+                if raster is not None:
+                    async_result.wait()
+                    raster.release()
+
+    def _result(self, item):
+        async_result, raster = item
+        try:
+            return async_result.get()
+        finally:
+            if raster is not None:
+                raster.release()
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def get_ocr_pool():
+    """
+    Returns the process-wide OCRWorkerPool, starting it on first use.
+    """
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = OCRWorkerPool()
+            atexit.register(_shared_pool.close)
+        return _shared_pool
+
+
+class SerializedOCREngine:
+    """
+    Wraps an OCR engine shared by several threads (scheduler workers, page
+    pipelines) so only one inference runs at a time; RapidOCR keeps per-call
+    state and isn't documented as thread-safe. Parallel OCR goes through the
+    worker pool instead.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._lock = threading.Lock()
+
+    def __call__(self, img, **kwargs):
+        with self._lock:
+            return self.engine(img, **kwargs)
+
+
+_shared_engine = None
+_shared_engine_lock = threading.Lock()
+
+
+def get_ocr_engine():
+    """
+    Returns the process-wide in-process OCR engine, shared by every PDFProcessor
+    so a long-running app or service loads the model only once.
+    Calls are serialised (see SerializedOCREngine).
+    """
+    global _shared_engine
+    with _shared_engine_lock:
+        if _shared_engine is None:
+            print("Initializing RapidOCR...")
+            _shared_engine = SerializedOCREngine(create_ocr_engine())
+        return _shared_engine
@@ -0,0 +1,70 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import Config
+from .encoder import encode_workers
+
+_DONE = object()
+
+
+class PagePipeline:
+    """
+    Runs pages through three overlapping stages connected by bounded queues:
+        render(item) -> produced          on the calling thread, one page at a time
+        process(item, produced) -> result on a pool of page threads
+        write(item, result)               on one writer thread, in input order
+    MuPDF calls are serialised (see docpool.mupdf_lock), while Pillow encoding,
+    OCR inference and file writes release the GIL, so the next page renders
+    while earlier ones are being processed and written. At most depth pages are between render and write,
+    which bounds the rasters held in memory. Threads only, so it suits small
+    containers where a process pool would be too heavy.
+    """
+
+    def __init__(self, render, process, write, workers=None, depth=None):
+        self.render = render
+        self.process = process
+        self.write = write
+        self.workers = workers or Config.PIPELINE_WORKERS or min(4, encode_workers())
+        self.depth = depth or Config.PIPELINE_DEPTH or self.workers * 2
+
+    def run(self, items, cancel_token=None):
+        """
+        Runs every item through the stages. Returns once the last one is written.
+        Items already handed on when the run fails or is cancelled are still
+        written (e.g. checkpointed) if they process successfully, then the
+        first error is raised.
+        """
+        written = queue.Queue(maxsize=self.depth) # (item, Future of process), in input order
+        errors = []
+
+        def writer():
+            while True:
+                entry = written.get()
+                if entry is _DONE:
+                    return
+                item, future = entry
+                try:
+                    self.write(item, future.result())
+                except BaseException as e:
+                    # Keep draining, so the render loop never blocks on a full queue
+                    errors.append(e)
+
+        writer_thread = threading.Thread(target=writer, name="pipeline-writer", daemon=True)
+        writer_thread.start()
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pipeline")
+        try:
+            for item in items:
+                if cancel_token:
+                    cancel_token.raise_if_cancelled()
+                if errors:
+                    break
+                produced = self.render(item)
+                # Blocks while depth pages are still waiting to be written
+                written.put((item, executor.submit(self.process, item, produced)))
+        finally:
+            written.put(_DONE)
+            writer_thread.join()
+            executor.shutdown(wait=True)
+        if errors:
+            raise errors[0]
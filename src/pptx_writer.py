@@ -0,0 +1,84 @@
+import re
+from xml.sax.saxutils import escape
+
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls
+from pptx.util import Pt
+
+
+# Same XML python-pptx produces for add_textbox() + word_wrap + one run with
+# font size, name and color (or no fill for invisible overlay text).
+_TEXTBOX_TEMPLATE = (
+    '<p:sp>'
+    '<p:nvSpPr><p:cNvPr id="{id}" name="TextBox {name_id}"/><p:cNvSpPr txBox="1"/><p:nvPr/></p:nvSpPr>'
+    '<p:spPr>'
+    '<a:xfrm><a:off x="{x}" y="{y}"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+    '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom><a:noFill/>'
+    '</p:spPr>'
+    '<p:txBody><a:bodyPr wrap="square"><a:spAutoFit/></a:bodyPr><a:lstStyle/>{paragraphs}</p:txBody>'
+    '</p:sp>'
+)
+_PARAGRAPH_TEMPLATE = '<a:p><a:r><a:rPr sz="{sz}">{fill}<a:latin typeface="{font}"/></a:rPr><a:t>{text}</a:t></a:r></a:p>'
+_EMPTY_PARAGRAPH = '<a:p/>'
+
+# python-pptx escapes control characters (invalid in XML) as _xHHHH_
+_CTRL_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _escape_text(text):
+    text = _CTRL_CHARS.sub(lambda m: "_x%04X_" % ord(m.group()), text)
+    return escape(text, {'"': "&quot;"})
+
+
+def _next_shape_id(sp_tree):
+    # Same rule as python-pptx: one more than the largest id used on the slide
+    used_ids = [int(id_str) for id_str in sp_tree.xpath("//@id") if id_str.isdigit()]
+    return max(used_ids) + 1 if used_ids else 1
+
+
+def add_textboxes(slide, boxes, font_name):
+    """
+    Appends text boxes to a slide in one operation instead of one
+    python-pptx object-layer round trip per shape, run and font attribute.
+    boxes: list of dicts with x, y, w, h and size in points, text, and color
+    as "RRGGBB" (None draws the text with no fill, i.e. invisible).
+    Text containing newlines becomes one paragraph per line.
+    """
+    if not boxes:
+        return
+
+    sp_tree = slide.shapes._spTree
+    shape_id = _next_shape_id(sp_tree)
+    font = _escape_text(font_name)
+
+    parts = []
+    for box in boxes:
+        if box["color"] is None:
+            fill = '<a:noFill/>'
+        else:
+            fill = '<a:solidFill><a:srgbClr val="%s"/></a:solidFill>' % box["color"].upper()
+        sz = Pt(box["size"]).centipoints
+
+        paragraphs = "".join(
+            _PARAGRAPH_TEMPLATE.format(sz=sz, fill=fill, font=font, text=_escape_text(line)) if line else _EMPTY_PARAGRAPH
+            for line in box["text"].split("\n")
+        )
+        parts.append(_TEXTBOX_TEMPLATE.format(
+            id=shape_id,
+            name_id=shape_id - 1,
+            x=int(Pt(box["x"])),
+            y=int(Pt(box["y"])),
+            cx=int(Pt(box["w"])),
+            cy=int(Pt(box["h"])),
+            paragraphs=paragraphs
+        ))
+        shape_id += 1
+
+    # Parse every shape in one go, then move them into the slide's shape tree
+    fragment = parse_xml("<p:spTree %s>%s</p:spTree>" % (nsdecls("p", "a", "r"), "".join(parts)))
+    ext_lst = sp_tree.find("{http://schemas.openxmlformats.org/presentationml/2006/main}extLst")
+    if ext_lst is None:
+        sp_tree.extend(list(fragment))
+    else:
+        for sp in list(fragment):
+            ext_lst.addprevious(sp)
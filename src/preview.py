@@ -0,0 +1,90 @@
+import collections
+import json
+import threading
+
+from PIL import ImageDraw
+
+from .config import Config
+
+
+class PreviewEngine:
+    """
+    Interactive watermark preview for one document.
+    Each previewed page is rendered once at display size and kept; a settings
+    change only copies that small raster and re-applies the watermark patch,
+    so moving a slider never goes back to the PDF. Switching pages renders
+    just the newly selected page.
+    """
+
+    def __init__(self, processor, width=None, max_pages=None):
+        self.processor = processor
+        self.width = width or Config.PREVIEW_WIDTH
+        self.max_pages = max_pages or Config.PREVIEW_CACHE_PAGES
+
+        self._bases = collections.OrderedDict() # page_num -> display-size raster, most recent last
+        self._last = None # (page_num, settings key, result) of the last render
+        self._lock = threading.Lock()
+
+    def base(self, page_num):
+        """
+        Returns page_num rendered at display width (shared, don't draw on it).
+        """
+        with self._lock:
+            img = self._bases.get(page_num)
+            if img is not None:
+                self._bases.move_to_end(page_num)
+                return img
+
+        rect = self.processor.page_rect(page_num)
+        dpi = int(min(Config.PREVIEW_MAX_DPI, self.width * 72.0 / rect.width))
+        # Reuses the page's pyramid if a job already built one, but never builds it
+        img = self.processor.page_raster(page_num, dpi, build=False)
+
+        with self._lock:
+            self._bases[page_num] = img
+            while len(self._bases) > self.max_pages:
+                self._bases.popitem(last=False)
+        return img
+
+    def render(self, page_num, wm_settings):
+        """
+        Returns (cleaned, annotated, source): the page with the watermark patch
+        applied, the same with the target (red) and source boxes drawn on it, and
+        the patch source in use ("mirror", "manual" or "mask").
+        """
+        key = json.dumps(wm_settings, sort_keys=True)
+        with self._lock:
+            if self._last is not None and self._last[:2] == (page_num, key):
+                return self._last[2]
+
+        cleaned = self.processor._apply_watermark_removal(self.base(page_num).copy(), wm_settings)
+        annotated = cleaned.copy()
+        source = self._draw_boxes(annotated, wm_settings)
+
+        result = (cleaned, annotated, source)
+        with self._lock:
+            self._last = (page_num, key, result)
+        return result
+
+    def _draw_boxes(self, img, wm_settings):
+        draw = ImageDraw.Draw(img)
+        w, h = img.size
+        line_width = max(1, round(3 * w / 1000))
+
+        tx = int(w * wm_settings["x_start"])
+        ty = int(h * wm_settings["y_start"])
+        tw = int(w * wm_settings["width"])
+        th = int(h * wm_settings["height"])
+        draw.rectangle([tx, ty, tx + tw, ty + th], outline="red", width=line_width)
+
+        if wm_settings.get("use_mirror_patch"):
+            # Symmetric source, as computed by _apply_watermark_removal
+            sx = w - (tx + tw)
+            draw.rectangle([sx, ty, sx + tw, ty + th], outline="blue", width=line_width)
+            return "mirror"
+        if wm_settings.get("use_patch"):
+            sx = int(w * wm_settings["src_x"])
+            sy = int(h * wm_settings["src_y"])
+            draw.rectangle([sx, sy, sx + tw, sy + th], outline="#00ff00", width=line_width)
+            return "manual"
+        return "mask"
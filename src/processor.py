@@ -2,19 +2,47 @@ import fitz  # PyMuPDF
 import os
 from PIL import Image, ImageFilter
 import io
-from pptx import Presentation
-from pptx.util import Pt, Inches
-from pptx.dml.color import RGBColor
+import hashlib
+import math
+import zipfile
+import collections
+import threading
 from .config import Config
+from .docpool import DocumentPool, mupdf_lock
+from .encoder import BackgroundEncoder, encode_workers, resolve_tiles
+from .jobs import JobCheckpoint, make_job_id
+from .layout import group_lines, group_paragraphs
+from .ocr_cache import OCRCache, get_ocr_cache, normalize_result
+from .ocr_pool import get_ocr_engine, get_ocr_pool
+from .pipeline import PagePipeline
+from .raster_cache import get_raster_cache
+from .workspace import get_workspace_manager
 
-from rapidocr_onnxruntime import RapidOCR
 import logging
-import numpy as np
-from opencc import OpenCC
 
 # Suppress PaddleOCR logging
 logging.getLogger("ppocr").setLevel(logging.ERROR)
 
+_loaded_fonts = {} # font file path -> {"fontname", "buffer", "font"}, shared by all processors
+_loaded_fonts_lock = threading.Lock()
+
+
+def load_font(path):
+    """
+    Reads and parses a font file once per process; later calls (from any
+    processor, or the service warm-up) get the same loaded font.
+    Returns {"fontname", "buffer", "font" (fitz.Font)}. Raises if the file can't be loaded.
+    """
+    with _loaded_fonts_lock:
+        font = _loaded_fonts.get(path)
+        if font is None:
+            with open(path, "rb") as f:
+                buffer = f.read()
+            with mupdf_lock:
+                font = {"fontname": "custom_font", "buffer": buffer, "font": fitz.Font(fontbuffer=buffer)}
+            _loaded_fonts[path] = font
+        return font
+
 class PDFProcessor:
     def __init__(self, input_path, output_dir=None, font_path=None):
         self.input_path = input_path
@@ -32,19 +60,159 @@ class PDFProcessor:
             else:
                 print(f"Warning: Font file not found at {self.font_path}. Text rendering might fail or use default.")
 
-        self.doc = fitz.open(self.input_path)
+        with mupdf_lock:
+            self.doc = fitz.open(self.input_path)
+            self.page_count = len(self.doc)
         self.filename = os.path.splitext(os.path.basename(input_path))[0]
         self.ocr = None # Lazy init
+        self.cc = None # Lazy init
+        self._page_kinds = {} # page_num -> classification from classify_page
+        self._page_dpis = {} # (page_num, variant) -> DPI cap from page_dpi
+        self._passthrough = {} # page_num -> embedded image info from _passthrough_image
+        self._fonts = {} # font path -> resolved font from _resolve_font
+        self._ocr_prefetched = {} # (page_num, ocr_clip) -> OCR text elements from prefetch_ocr
+        self._doc_hash = None # Lazy, see doc_hash
+        self._doc_pool = None # Lazy, see doc_pool
+        # Guards the lazy inits and the memo dicts above, pipeline page threads share them
+        self._lock = threading.RLock()
 
     def _init_ocr(self):
-        if self.ocr is None:
-            # Initialize PaddleOCR
-            # Disable angle classifier to avoid "unexpected keyword argument 'cls'" error
-            # NotebookLM slides are usually horizontal anyway
-            print("Initializing RapidOCR...")
-            print("Initializing RapidOCR...")
-            self.ocr = RapidOCR()
-            self.cc = OpenCC('s2t') # Simplified to Traditional
+        with self._lock:
+            if self.ocr is None:
+                # Initialize PaddleOCR
+                # Disable angle classifier to avoid "unexpected keyword argument 'cls'" error
+                # NotebookLM slides are usually horizontal anyway
+                self.ocr = get_ocr_engine()
+            self._init_converter()
+
+    def _init_converter(self):
+        with self._lock:
+            if self.cc is None:
+                from opencc import OpenCC
+                self.cc = OpenCC('s2t') # Simplified to Traditional
+
+    def _ocr_config(self):
+        """
+        Describes everything besides the raster that influences OCR output.
+        Part of the OCR cache key, so bump it whenever the OCR setup changes.
+        """
+        try:
+            from importlib.metadata import version
+            engine_version = version("rapidocr_onnxruntime")
+        except Exception:
+            engine_version = "unknown"
+        return {"engine": "rapidocr_onnxruntime", "version": engine_version}
+
+    def _run_ocr(self, img):
+        """
+        Runs OCR on a numpy RGB image, going through the persistent OCR cache.
+        Returns the raw RapidOCR result list ([dt_box, text, score] items).
+        """
+        key = OCRCache.make_key(img, self._ocr_config())
+        cache = get_ocr_cache()
+        if cache is not None:
+            result = cache.get(key)
+            if result is not None:
+                return result
+
+        self._init_ocr()
+        result, elapse = self.ocr(img)
+        if cache is not None:
+            return cache.put(key, result)
+        return normalize_result(result)
+
+    def prefetch_ocr(self, page_nums, progress_callback=None):
+        """
+        OCRs all given pages that need it in parallel on the OCR worker pool.
+        Results land in the OCR cache, and the text elements built from them are
+        kept for extract_elements, so pages are neither OCRed nor rendered again.
+        Falls back to the lazy serial path for small jobs.
+        """
+        cache = get_ocr_cache()
+        ocr_config = self._ocr_config()
+        rendered = collections.deque() # (page_num, ocr_clip, img, clip) of the tasks in flight, in order
+        
+        def pending_tasks():
+            for page_num in page_nums:
+                page_info = self.classify_page(page_num)
+                if page_info["kind"] == "native":
+                    continue
+                img, clip = self._render_ocr_image(page_num, page_info["ocr_clip"])
+                key = OCRCache.make_key(img, ocr_config)
+                result = cache.get(key) if cache is not None else None
+                if result is not None:
+                    elements = self._ocr_elements(img, clip, result)
+                    with self._lock:
+                        self._ocr_prefetched[(page_num, page_info["ocr_clip"])] = elements
+                    continue
+                rendered.append((page_num, page_info["ocr_clip"], img, clip))
+                yield key, img
+
+        # Check up front whether there's enough work to make the pool worthwhile
+        ocr_pages = [p for p in page_nums if self.classify_page(p)["kind"] != "native"]
+        if len(ocr_pages) < 2 or Config.OCR_WORKERS == 1:
+            return
+
+        try:
+            pool = get_ocr_pool()
+        except Exception as e:
+            print(f"OCR worker pool unavailable, running OCR serially: {e}")
+            return
+
+        done = 0
+        for key, result in pool.run(pending_tasks()):
+            result = cache.put(key, result) if cache is not None else normalize_result(result)
+            # The pool yields in submission order
+            page_num, ocr_clip, img, clip = rendered.popleft()
+            elements = self._ocr_elements(img, clip, result)
+            with self._lock:
+                self._ocr_prefetched[(page_num, ocr_clip)] = elements
+            done += 1
+            if progress_callback:
+                progress_callback(done / len(ocr_pages), f"OCR {done}/{len(ocr_pages)} pages")
+
+    def warm_caches(self, enable_ocr=True, progress_callback=None, cancel_token=None):
+        """
+        Speculatively computes what a later conversion of this document reads from the
+        process-wide caches: the document hash, the OCR classification, OCR results
+        (persistent OCR cache) and the text-stripped background pyramids (raster cache,
+        only as many as fit without evicting). Meant to run as a background-priority
+        job right after upload; it is cancelled at any page boundary without losing
+        what it already cached.
+        """
+        self.doc_hash
+        cache = get_raster_cache()
+        rasters_fit = True
+        for page_num in range(self.page_count):
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+            if progress_callback:
+                progress_callback(page_num / self.page_count, f"Warming up page {page_num + 1}/{self.page_count}")
+
+            # 1. OCR classification and results (OCR goes page by page, so it yields quickly)
+            page_info = self.classify_page(page_num)
+            if enable_ocr and page_info["kind"] != "native":
+                self.extract_elements(page_num, enable_ocr=True)
+
+            # 2. Background pyramid (passthrough and banded pages never read one)
+            if not rasters_fit or self._passthrough_image(page_num) is not None:
+                continue
+            dpi = min(cache.base_dpi, self.page_dpi(page_num, "background"))
+            with mupdf_lock:
+                page = self.doc[page_num]
+                needs_banding = self._needs_banding(page, dpi)
+                rect = page.rect
+            if needs_banding:
+                continue
+            # Base level + the smaller levels (about a third more), RGB
+            pyramid_bytes = rect.width * rect.height * (dpi / 72.0) ** 2 * 3 * 4 / 3
+            if cache.stats()["bytes"] + pyramid_bytes > cache.max_bytes:
+                rasters_fit = False
+                continue
+            self.page_raster(page_num, dpi, variant="background")
+
+        if progress_callback:
+            progress_callback(1.0, "Warm-up complete")
 
     def get_page_thumbnails(self, dpi=72):
         """
@@ -52,13 +220,198 @@ class PDFProcessor:
         Returns a list of tuples: (page_num, pil_image)
         """
         thumbnails = []
-        for page_num in range(len(self.doc)):
-            page = self.doc[page_num]
-            pix = page.get_pixmap(dpi=dpi)
-            img = Image.open(io.BytesIO(pix.tobytes()))
+        for page_num in range(self.page_count):
+            # Reuse a page's pyramid if there is one, but don't build it just for a thumbnail
+            img = self.page_raster(page_num, dpi, build=False)
             thumbnails.append((page_num + 1, img))
         return thumbnails
 
+    def _render_pixmap_image(self, page, dpi):
+        with mupdf_lock:
+            pix = page.get_pixmap(dpi=dpi)
+            return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+    def page_raster(self, page_num, dpi, variant="page", build=True, exact=False):
+        """
+        Returns the page as a PIL image at dpi, served from the shared resolution
+        pyramid (see raster_cache), so each page is rendered once for every consumer.
+        variant: "page" (as is) or "background" (text redacted, see _open_redacted_page).
+        exact: serve it from a pyramid of its own that is always rendered at dpi, so
+        the pixels don't depend on which resolutions were requested before (e.g. OCR
+        input, whose hash keys the OCR cache).
+        Pages too large to render whole bypass the pyramid.
+        """
+        passthrough = self._passthrough_image(page_num)
+        if passthrough is not None and (variant == "background" or not passthrough["has_text"]):
+            # A full-bleed image page is its image: decode it rather than render the page
+            def render(render_dpi):
+                return self._decode_passthrough(page_num, render_dpi)
+        elif variant == "background":
+            def render(render_dpi):
+                with mupdf_lock:
+                    doc_bg, page_bg = self._open_redacted_page(page_num)
+                    try:
+                        return self._render_pixmap_image(page_bg, render_dpi)
+                    finally:
+                        doc_bg.close()
+        else:
+            def render(render_dpi):
+                with self.doc_pool.lend() as doc:
+                    return self._render_pixmap_image(doc[page_num], render_dpi)
+
+        # Never go past what the page actually holds (see page_dpi)
+        cap = self.page_dpi(page_num, variant)
+        dpi = min(dpi, cap)
+
+        cache = get_raster_cache()
+        with mupdf_lock:
+            needs_banding = self._needs_banding(self.doc[page_num], dpi)
+        if needs_banding:
+            return render(dpi)
+        if exact:
+            return cache.get((self.doc_hash, page_num, variant, dpi), dpi, render, build=build, base_dpi=dpi)
+        return cache.get((self.doc_hash, page_num, variant), dpi, render, build=build, base_dpi=cap)
+
+    def page_dpi(self, page_num, variant="page"):
+        """
+        Highest DPI worth rendering a page at (see Config.ADAPTIVE_DPI).
+        A page that is essentially one embedded raster is capped at that image's native
+        resolution, clamped to ADAPTIVE_DPI_MIN..ADAPTIVE_DPI_MAX. Vector drawings (and,
+        for variant "page", native text) on top of the image keep the page uncapped.
+        """
+        if not Config.ADAPTIVE_DPI:
+            return float("inf")
+        with self._lock:
+            if (page_num, variant) in self._page_dpis:
+                return self._page_dpis[(page_num, variant)]
+
+        with mupdf_lock:
+            page = self.doc[page_num]
+            page_rect = page.rect
+            cap = Config.ADAPTIVE_DPI_MAX
+
+            dominant = max(page.get_image_info(), key=lambda info: abs(fitz.Rect(info["bbox"]) & page_rect), default=None)
+            if dominant is not None:
+                bbox = fitz.Rect(dominant["bbox"])
+                coverage = abs(bbox & page_rect) / (abs(page_rect) or 1.0)
+                if coverage >= Config.ADAPTIVE_DPI_MIN_COVERAGE and abs(bbox) > 0:
+                    has_text = variant == "page" and page.get_text("text", flags=fitz.TEXTFLAGS_TEXT).strip()
+                    if not has_text and not page.get_drawings():
+                        # Image pixels per inch of page, area based so rotation doesn't matter
+                        native = 72.0 * math.sqrt(dominant["width"] * dominant["height"] / abs(bbox))
+                        cap = min(Config.ADAPTIVE_DPI_MAX, max(Config.ADAPTIVE_DPI_MIN, math.ceil(native)))
+
+        with self._lock:
+            self._page_dpis[(page_num, variant)] = cap
+        return cap
+
+    def _passthrough_image(self, page_num):
+        """
+        Detects pages that are one upright, full-bleed embedded raster (the usual
+        NotebookLM export) stored in a codec we can pass through (Config.PASSTHROUGH_FORMATS).
+        Returns {"xref", "ext", "dpi", "has_text"} or None.
+        """
+        if not Config.IMAGE_PASSTHROUGH:
+            return None
+        with self._lock:
+            if page_num in self._passthrough:
+                return self._passthrough[page_num]
+
+        # Borrow before taking mupdf_lock, lend may wait for a handle to come back
+        with self.doc_pool.lend() as doc, mupdf_lock:
+            result = None
+            page = doc[page_num]
+            images = page.get_images(full=True)
+            infos = page.get_image_info()
+            if len(images) == 1 and len(infos) == 1 and page.rotation == 0:
+                xref, smask = images[0][0], images[0][1]
+                info = infos[0]
+                bbox = fitz.Rect(info["bbox"])
+                a, b, c, d = info["transform"][:4]
+                upright = a > 0 and d > 0 and b == 0 and c == 0
+                full_bleed = all(abs(bbox[i] - page.rect[i]) <= 0.5 for i in range(4))
+                if upright and full_bleed and smask == 0 and not page.get_drawings():
+                    extracted = doc.extract_image(xref)
+                    if extracted and extracted["ext"] in Config.PASSTHROUGH_FORMATS and extracted["colorspace"] in (1, 3):
+                        result = {
+                            "xref": xref,
+                            "ext": extracted["ext"],
+                            "dpi": 72.0 * extracted["width"] / bbox.width,
+                            "has_text": bool(page.get_text("text", flags=fitz.TEXTFLAGS_TEXT).strip())
+                        }
+
+        with self._lock:
+            self._passthrough[page_num] = result
+        return result
+
+    def _decode_passthrough(self, page_num, dpi=None):
+        """
+        Decodes the embedded image of a passthrough page, scaled to dpi (native if None).
+        """
+        info = self._passthrough_image(page_num)
+        with self.doc_pool.lend() as doc, mupdf_lock:
+            data = doc.extract_image(info["xref"])["image"]
+            rect = doc[page_num].rect
+        img = Image.open(io.BytesIO(data))
+        if dpi is None:
+            return img.convert("RGB")
+
+        size = (max(1, round(rect.width * dpi / 72.0)), max(1, round(rect.height * dpi / 72.0)))
+        img.draft("RGB", size) # JPEG: let the decoder scale down by 1/2, 1/4 or 1/8
+        img = img.convert("RGB")
+        if abs(img.width - size[0]) > 1 or abs(img.height - size[1]) > 1:
+            img = img.resize(size, Image.BOX if img.width > size[0] else Image.BICUBIC)
+        return img
+
+    def _watermark_box(self, w, h, wm_settings):
+        # Pixel box patched by _apply_watermark_removal, None without watermark settings
+        if not wm_settings or "x_start" not in wm_settings:
+            return None
+        x0 = int(w * wm_settings["x_start"])
+        y0 = int(h * wm_settings["y_start"])
+        box = (max(0, x0), max(0, y0), min(w, x0 + int(w * wm_settings["width"])), min(h, y0 + int(h * wm_settings["height"])))
+        return box if box[2] > box[0] and box[3] > box[1] else None
+
+    def _passthrough_tiles(self, page_num, dpi, wm_settings=None, variant="background"):
+        """
+        Background tiles for a passthrough page without rendering or re-encoding:
+        the embedded image as stored, plus a small PNG patch over the watermark.
+        Returns (tiles, patched image at native resolution) or None if the page doesn't
+        qualify or its image is much sharper than dpi needs (PASSTHROUGH_MAX_DPI_RATIO).
+        """
+        info = self._passthrough_image(page_num)
+        if info is None or info["dpi"] > dpi * Config.PASSTHROUGH_MAX_DPI_RATIO:
+            return None
+        if variant == "page" and info["has_text"]:
+            return None # The visible text would be lost
+
+        with self.doc_pool.lend() as doc, mupdf_lock:
+            rect = doc[page_num].rect
+            tiles = [(doc.extract_image(info["xref"])["image"], info["ext"], None)]
+        img = self._decode_passthrough(page_num)
+        box = self._watermark_box(img.width, img.height, wm_settings)
+        if box is not None:
+            img = self._apply_watermark_removal(img, wm_settings)
+            buf = io.BytesIO()
+            img.crop(box).save(buf, "PNG", optimize=True)
+            sx = rect.width / img.width
+            sy = rect.height / img.height
+            # Relative to the page's top-left corner, like the tiles of _render_bands
+            patch_rect = (box[0] * sx, box[1] * sy, box[2] * sx, box[3] * sy)
+            tiles.append((buf.getvalue(), "png", patch_rect))
+        return tiles, img
+
+    def _report_dpis(self, page_nums, dpi, variant="background"):
+        """
+        Prints how many pages were rendered at which DPI.
+        """
+        counts = {}
+        for page_num in page_nums:
+            chosen = min(dpi, self.page_dpi(page_num, variant))
+            counts[chosen] = counts.get(chosen, 0) + 1
+        summary = ", ".join(f"{n} page(s) at {chosen:g}" for chosen, n in sorted(counts.items(), reverse=True))
+        print(f"Render DPI (requested {dpi}): {summary}")
+
     def _apply_watermark_removal(self, img, wm_settings):
         """
         Applies watermark removal to the given image based on settings.
@@ -98,17 +451,254 @@ class PDFProcessor:
             
         return img
 
+    def classify_page(self, page_num):
+        """
+        Cheap pre-pass that decides whether OCR is worth running on a page.
+        Returns a dict with "kind" ("native", "mixed" or "needs_ocr") plus the
+        measurements behind it: span count, image coverage and text score.
+        """
+        with self._lock:
+            if page_num in self._page_kinds:
+                return self._page_kinds[page_num]
+
+        # A borrowed handle (see doc_pool), classification also runs on background threads
+        with self.doc_pool.lend() as doc, mupdf_lock:
+            page = doc[page_num]
+            page_rect = page.rect
+            page_area = abs(page_rect) or 1.0
+
+            # 1. Native text spans (TEXTFLAGS_TEXT skips image payloads, so this is cheap)
+            span_count = 0
+            span_rects = []
+            for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+                for line in block.get("lines", []):
+                    for span in line["spans"]:
+                        if span["text"].strip():
+                            span_count += 1
+                            span_rects.append(fitz.Rect(span["bbox"]))
+
+            # 2. Image coverage (overlaps are rare in slides, so summing areas is good enough)
+            image_area = 0.0
+            image_clip = None
+            for info in page.get_image_info():
+                rect = fitz.Rect(info["bbox"]) & page_rect
+                if rect.is_empty:
+                    continue
+                image_area += abs(rect)
+                image_clip = rect if image_clip is None else image_clip | rect
+            image_coverage = min(1.0, image_area / page_area)
+
+            # 3. Low-DPI text likelihood
+            # Probe the image area; with almost no native text also probe the whole page
+            # so text drawn as vector outlines is still caught.
+            if image_coverage >= Config.OCR_MIN_IMAGE_COVERAGE:
+                probe_clip = image_clip
+            elif span_count < Config.OCR_MIN_SPANS:
+                probe_clip = page_rect
+            else:
+                probe_clip = None
+
+            text_score = 0.0
+            if probe_clip is not None:
+                pix = page.get_pixmap(dpi=Config.OCR_PROBE_DPI, colorspace=fitz.csGRAY, clip=probe_clip)
+                if pix.width > 1 and pix.height > 0:
+                    import numpy as np
+                    gray = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+                    # Glyph strokes produce dense, sharp horizontal transitions; photos and gradients don't
+                    edges = np.abs(np.diff(gray.astype(np.int16), axis=1)) > 32
+                    # Only text baked into the raster counts: mask out the native spans drawn over it
+                    keep = np.ones(edges.shape, dtype=bool)
+                    scale = Config.OCR_PROBE_DPI / 72.0
+                    for rect in span_rects:
+                        x0 = max(0, int((rect.x0 - probe_clip.x0) * scale) - 1)
+                        y0 = max(0, int((rect.y0 - probe_clip.y0) * scale) - 1)
+                        x1 = int(math.ceil((rect.x1 - probe_clip.x0) * scale)) + 1
+                        y1 = int(math.ceil((rect.y1 - probe_clip.y0) * scale)) + 1
+                        if x1 > 0 and y1 > 0:
+                            keep[y0:y1, x0:x1] = False
+                    if keep.any():
+                        text_score = float(edges[keep].mean())
+
+        if text_score < Config.OCR_TEXT_EDGE_DENSITY:
+            kind = "native"
+        elif span_count < Config.OCR_MIN_SPANS:
+            kind = "needs_ocr"
+        else:
+            kind = "mixed"
+
+        result = {
+            "page": page_num + 1, # 1-based for display
+            "kind": kind,
+            "spans": span_count,
+            "image_coverage": image_coverage,
+            "text_score": text_score,
+            # Mixed pages only OCR the image area, native text is already extracted
+            "ocr_clip": tuple(image_clip) if kind == "mixed" and image_clip is not None else None
+        }
+        with self._lock:
+            self._page_kinds[page_num] = result
+        return result
+
+    def classify_pages(self, progress_callback=None):
+        """
+        Classifies every page of the document (see classify_page).
+        Returns a list of classification dicts in page order.
+        """
+        total_pages = self.page_count
+        results = []
+        for page_num in range(total_pages):
+            if progress_callback:
+                progress_callback(page_num / total_pages, f"Classifying page {page_num + 1}/{total_pages}")
+            results.append(self.classify_page(page_num))
+        return results
+
+    def _convert_ocr_text(self, text):
+        """
+        Converts OCR output to Traditional Chinese and applies custom corrections.
+        """
+        # 1. Protect ignored characters (e.g., "台")
+        # Replace them with a unique placeholder that OpenCC won't touch
+        protected_text = text
+        placeholders = {}
+        for i, char in enumerate(Config.OPENCC_IGNORE_CHARS):
+            placeholder = f"__IGNORE_{i}__"
+            if char in protected_text:
+                protected_text = protected_text.replace(char, placeholder)
+                placeholders[placeholder] = char
+        
+        # 2. Convert Simplified to Traditional Chinese
+        converted_text = self.cc.convert(protected_text)
+        
+        # 3. Restore ignored characters
+        for placeholder, original_char in placeholders.items():
+            converted_text = converted_text.replace(placeholder, original_char)
+            
+        text = converted_text
+        
+        # 4. Apply Custom Corrections (e.g., 臺 -> 台)
+        for wrong, correct in Config.TEXT_CORRECTIONS.items():
+            text = text.replace(wrong, correct)
+        return text
+
+    def _render_ocr_image(self, page_num, clip=None):
+        """
+        Renders a page (or only the clip area of it) as OCR input.
+        Returns (numpy RGB image, clip rect).
+        """
+        import numpy as np
+
+        rect = self.page_rect(page_num)
+        clip = fitz.Rect(clip) if clip else rect
+        
+        # Get page image for OCR
+        # Use 150 DPI (down from 200) to improve speed while maintaining acceptable accuracy
+        # Always rendered at exactly OCR_DPI, so the same page hashes the same for the OCR cache
+        img = self.page_raster(page_num, Config.OCR_DPI, exact=True)
+        
+        if clip != rect:
+            # Crop on whole pixels and report the clip those pixels actually cover
+            sx = img.width / rect.width
+            sy = img.height / rect.height
+            box = (
+                max(0, int((clip.x0 - rect.x0) * sx)), max(0, int((clip.y0 - rect.y0) * sy)),
+                min(img.width, int(round((clip.x1 - rect.x0) * sx))), min(img.height, int(round((clip.y1 - rect.y0) * sy)))
+            )
+            img = img.crop(box)
+            clip = fitz.Rect(rect.x0 + box[0] / sx, rect.y0 + box[1] / sy, rect.x0 + box[2] / sx, rect.y0 + box[3] / sy)
+        
+        # Convert to numpy array for RapidOCR
+        return np.asarray(img), clip
+
+    def _ocr_page(self, page_num, clip=None):
+        """
+        Runs OCR on a page (or only the clip area of it).
+        Returns text elements in page coordinates.
+        """
+        with self._lock:
+            prefetched = self._ocr_prefetched.get((page_num, clip))
+        if prefetched is not None:
+            return list(prefetched)
+
+        img, rect = self._render_ocr_image(page_num, clip)
+        
+        # Run OCR with RapidOCR (cached by raster hash), outside mupdf_lock so other pages keep rendering
+        return self._ocr_elements(img, rect, self._run_ocr(img))
+
+    def _ocr_elements(self, img, clip, result):
+        """
+        Turns an OCR result on img, the render of the clip rect, into text
+        elements in page coordinates.
+        """
+        self._init_converter()
+        text_instances = []
+        if not result:
+            return text_instances
+
+        h_img, w_img, _ = img.shape
+        scale_x = clip.width / w_img
+        scale_y = clip.height / h_img
+        
+        for item in result:
+            # item structure: [dt_box, text, score]
+            # dt_box: [[x1, y1], [x2, y2], [x3, y3], [x4, y4]]
+            dt_box, text, score = item
+            
+            if score < 0.5: continue
+            
+            text = self._convert_ocr_text(text)
+            
+            # Bbox in pixel coordinates of the rendered clip
+            xs = [p[0] for p in dt_box]
+            ys = [p[1] for p in dt_box]
+            
+            # Sample color from image
+            # Ensure bounds
+            ix0 = max(0, int(min(xs)))
+            iy0 = max(0, int(min(ys)))
+            ix1 = min(w_img, int(max(xs)))
+            iy1 = min(h_img, int(max(ys)))
+            
+            if ix1 > ix0 and iy1 > iy0:
+                # Crop region
+                region = img[iy0:iy1, ix0:ix1]
+                # Get average color (simple mean)
+                avg_color = region.mean(axis=(0, 1)).astype(int) # RGB
+                hex_color = "#{:02x}{:02x}{:02x}".format(avg_color[0], avg_color[1], avg_color[2])
+            else:
+                hex_color = "#000000" # Fallback to black
+
+            # Calculate bbox in page coordinates
+            x0 = clip.x0 + min(xs) * scale_x
+            y0 = clip.y0 + min(ys) * scale_y
+            x1 = clip.x0 + max(xs) * scale_x
+            y1 = clip.y0 + max(ys) * scale_y
+            
+            # Estimate font size
+            size = (y1 - y0) * 0.8
+
+            text_instances.append({
+                "text": text,
+                "bbox": (x0, y0, x1, y1),
+                "size": size,
+                "color": hex_color,
+                "origin": (x0, y1)
+            })
+        
+        return text_instances
+
     def extract_elements(self, page_num, enable_ocr=False):
         """
         Extracts text blocks from a page.
         Returns a list of dictionaries containing text, bbox, size, color.
         """
-        page = self.doc[page_num]
+        # A borrowed handle (see doc_pool), pages are extracted on pipeline threads too;
+        # it is returned before OCR, so other threads can extract meanwhile
+        with self.doc_pool.lend() as doc, mupdf_lock:
+            blocks = doc[page_num].get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]
+
         text_instances = []
         
         # 1. Try standard PDF extraction first
-        blocks = page.get_text("dict")["blocks"]
-        
         for block in blocks:
             if "lines" in block:
                 for line in block["lines"]:
@@ -133,315 +723,877 @@ class PDFProcessor:
                         })
         
         # 2. OCR Fallback
-        # If no text found, or very little text (e.g. just page numbers), try OCR
-        if enable_ocr and len(text_instances) < 5: # Threshold can be adjusted
-            print(f"Page {page_num}: Low text count ({len(text_instances)}). Attempting OCR...")
-            self._init_ocr()
-            
-            # Get page image for OCR
-            # Use 150 DPI (down from 200) to improve speed while maintaining acceptable accuracy
-            pix = page.get_pixmap(dpi=150)
-            
-            # Convert to numpy array for RapidOCR
-            # pix.samples is bytes
-            img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
-            
-            # Handle Alpha channel if present
-            if pix.n == 4:
-                img = np.ascontiguousarray(img[..., :3]) # Drop alpha, keep RGB
-            elif pix.n == 3:
-                pass # Already RGB
-            
-            # Run OCR with RapidOCR
-            result, elapse = self.ocr(img)
-            
-            if result:
-                scale_x = page.rect.width / pix.width
-                scale_y = page.rect.height / pix.height
-                
-                for item in result:
-                    # item structure: [dt_box, text, score]
-                    # dt_box: [[x1, y1], [x2, y2], [x3, y3], [x4, y4]]
-                    dt_box, text, score = item
-                    
-                    # 1. Protect ignored characters (e.g., "台")
-                    # Replace them with a unique placeholder that OpenCC won't touch
-                    protected_text = text
-                    placeholders = {}
-                    for i, char in enumerate(Config.OPENCC_IGNORE_CHARS):
-                        placeholder = f"__IGNORE_{i}__"
-                        if char in protected_text:
-                            protected_text = protected_text.replace(char, placeholder)
-                            placeholders[placeholder] = char
-                    
-                    # 2. Convert Simplified to Traditional Chinese
-                    converted_text = self.cc.convert(protected_text)
-                    
-                    # 3. Restore ignored characters
-                    for placeholder, original_char in placeholders.items():
-                        converted_text = converted_text.replace(placeholder, original_char)
-                        
-                    text = converted_text
-                    
-                    # 4. Apply Custom Corrections (e.g., 臺 -> 台)
-                    for wrong, correct in Config.TEXT_CORRECTIONS.items():
-                        text = text.replace(wrong, correct)
-                    
-                    if score < 0.5: continue
-                    
-                    # Calculate bbox from dt_box
-                    xs = [p[0] for p in dt_box]
-                    ys = [p[1] for p in dt_box]
-                    x0 = min(xs) * scale_x
-                    y0 = min(ys) * scale_y
-                    x1 = max(xs) * scale_x
-                    y1 = max(ys) * scale_y
-                    
-                    # Estimate font size
-                    size = (y1 - y0) * 0.8
-                    
-                    # Sample color from image
-                    # Convert bbox to pixel coordinates for sampling
-                    ix0 = int(x0 / scale_x)
-                    iy0 = int(y0 / scale_y)
-                    ix1 = int(x1 / scale_x)
-                    iy1 = int(y1 / scale_y)
-                    
-                    # Ensure bounds
-                    h_img, w_img, _ = img.shape
-                    ix0 = max(0, ix0)
-                    iy0 = max(0, iy0)
-                    ix1 = min(w_img, ix1)
-                    iy1 = min(h_img, iy1)
-                    
-                    if ix1 > ix0 and iy1 > iy0:
-                        # Crop region
-                        region = img[iy0:iy1, ix0:ix1]
-                        # Get average color (simple mean)
-                        avg_color = region.mean(axis=(0, 1)).astype(int) # RGB
-                        hex_color = "#{:02x}{:02x}{:02x}".format(avg_color[0], avg_color[1], avg_color[2])
-                    else:
-                        hex_color = "#000000" # Fallback to black
-
-                    text_instances.append({
-                        "text": text,
-                        "bbox": (x0, y0, x1, y1),
-                        "size": size,
-                        "color": hex_color,
-                        "origin": (x0, y1)
-                    })
+        # Only where the pre-pass classifier says there is raster text worth reading
+        if enable_ocr:
+            page_info = self.classify_page(page_num)
+            if page_info["kind"] == "needs_ocr":
+                print(f"Page {page_num}: Low text count ({len(text_instances)}). Attempting OCR...")
+                text_instances.extend(self._ocr_page(page_num))
+            elif page_info["kind"] == "mixed":
+                print(f"Page {page_num}: Text found inside images. Attempting OCR on image area...")
+                native_rects = [fitz.Rect(elem["bbox"]) for elem in text_instances]
+                for elem in self._ocr_page(page_num, clip=page_info["ocr_clip"]):
+                    # Skip OCR hits that duplicate native text
+                    rect = fitz.Rect(elem["bbox"])
+                    center = fitz.Point((rect.x0 + rect.x1) / 2, (rect.y0 + rect.y1) / 2)
+                    if any(center in native for native in native_rects):
+                        continue
+                    text_instances.append(elem)
         
         return text_instances
+
     def clean_page_image(self, page_num, dpi=300, wm_settings=None):
         """
         Renders the page as an image and removes the watermark.
         Returns a PIL Image object.
         """
-        page = self.doc[page_num]
-        pix = page.get_pixmap(dpi=dpi)
-        img = Image.open(io.BytesIO(pix.tobytes()))
+        img = self.page_raster(page_num, dpi)
         
         if wm_settings:
             img = self._apply_watermark_removal(img, wm_settings)
         
         return img
 
+    def _open_redacted_page(self, page_num):
+        """
+        Opens a fresh handle of the document with all text redacted from page_num.
+        Returns (doc, page); the caller closes the doc.
+        """
+        # Open a fresh handle to avoid messing up the main doc state if we were to modify it
+        with mupdf_lock:
+            doc_bg = self.doc_pool.open()
+            page_bg = doc_bg[page_num]
+
+            # Redact all text
+            text_blocks = page_bg.get_text("blocks")
+            for block in text_blocks:
+                # block: (x0, y0, x1, y1, "text", block_no, block_type)
+                if block[6] == 0: # Text block
+                    rect = fitz.Rect(block[:4])
+                    # Add redaction annotation
+                    # fill=None means no fill color (transparent/white depending on viewer, but usually removes content)
+                    page_bg.add_redact_annot(rect)
+
+            # Apply redactions
+            # images=fitz.PDF_REDACT_IMAGE_NONE ensures we DON'T remove images that might be under the text
+            # graphics=fitz.PDF_REDACT_IMAGE_NONE ensures we keep vector graphics (lines etc)
+            page_bg.apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE, graphics=fitz.PDF_REDACT_IMAGE_NONE)
+        return doc_bg, page_bg
+
     def get_background_image(self, page_num, dpi=300, wm_settings=None):
         """
         Hides text, renders page to image (background only), then restores text.
         """
-        # Open a fresh handle to avoid messing up the main doc state if we were to modify it
-        doc_bg = fitz.open(self.input_path)
-        page_bg = doc_bg[page_num]
-        
-        # Redact all text
-        text_blocks = page_bg.get_text("blocks")
-        for block in text_blocks:
-            # block: (x0, y0, x1, y1, "text", block_no, block_type)
-            if block[6] == 0: # Text block
-                rect = fitz.Rect(block[:4])
-                # Add redaction annotation
-                # fill=None means no fill color (transparent/white depending on viewer, but usually removes content)
-                page_bg.add_redact_annot(rect)
-                
-        # Apply redactions
-        # images=fitz.PDF_REDACT_IMAGE_NONE ensures we DON'T remove images that might be under the text
-        # graphics=fitz.PDF_REDACT_IMAGE_NONE ensures we keep vector graphics (lines etc)
-        page_bg.apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE, graphics=fitz.PDF_REDACT_IMAGE_NONE)
-        
-        # Now render
-        pix = page_bg.get_pixmap(dpi=dpi)
-        img = Image.open(io.BytesIO(pix.tobytes()))
+        img = self.page_raster(page_num, dpi, variant="background")
         
-        doc_bg.close()
-        
-        # Apply Watermark Mask
         # Apply Watermark Mask
         if wm_settings:
             img = self._apply_watermark_removal(img, wm_settings)
         
         return img
 
-    def render_new_pdf(self, wm_settings=None, debug_mode=False, enable_ocr=False, progress_callback=None, pages_to_remove=None):
+    def _needs_banding(self, page, dpi):
         """
-        Creates a new PDF with high-quality text and original background.
-        pages_to_remove: List of 0-based page numbers to skip.
+        True if the full raster of page at dpi would exceed RENDER_BAND_THRESHOLD_PIXELS.
+        """
+        pixels = page.rect.width * page.rect.height * (dpi / 72.0) ** 2
+        return pixels > Config.RENDER_BAND_THRESHOLD_PIXELS
+
+    def _render_bands(self, page, dpi):
+        """
+        Renders a page as horizontal bands using get_pixmap(clip=...).
+        Yields (band_rect, band_top_px, PIL image); only one band is alive at a time.
+        band_rect is relative to the page's top-left corner (the origin of the output
+        page), band_top_px is the band's first row in the full page raster.
+        """
+        scale = dpi / 72.0
+        with mupdf_lock:
+            rect = page.rect
+        band_top = 0
+        while True:
+            # Each band starts on the row after the pixels actually rendered so far,
+            # so rounding inside MuPDF can't leave a seam or an overlap
+            y0 = band_top / scale
+            if rect.y0 + y0 >= rect.y1:
+                break
+            clip = fitz.Rect(rect.x0, rect.y0 + y0, rect.x1, min(rect.y0 + (band_top + Config.RENDER_BAND_HEIGHT) / scale, rect.y1))
+            with mupdf_lock:
+                pix = page.get_pixmap(dpi=dpi, clip=clip)
+                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+                pix = None
+            if img.height == 0:
+                break
+            band_rect = fitz.Rect(0, y0, rect.width, min((band_top + img.height) / scale, rect.height))
+            yield band_rect, band_top, img
+            band_top += img.height
+
+    def _apply_watermark_removal_band(self, band_img, band_top, page, dpi, wm_settings):
+        """
+        Band-wise equivalent of _apply_watermark_removal.
+        band_top is the band's first pixel row within the full page raster.
+        """
+        if not wm_settings:
+            return band_img
+        
+        # Watermark geometry in full-page pixel coordinates
+        w = band_img.width
+        with mupdf_lock:
+            h = int(round(page.rect.height * dpi / 72.0))
+        x_start = int(w * wm_settings["x_start"])
+        y_start = int(h * wm_settings["y_start"])
+        width = int(w * wm_settings["width"])
+        height = int(h * wm_settings["height"])
+        
+        # Rows of the watermark that fall into this band
+        row0 = max(y_start, band_top)
+        row1 = min(y_start + height, band_top + band_img.height)
+        if row1 <= row0 or width <= 0:
+            return band_img
+        
+        if wm_settings.get("use_mirror_patch", False):
+            # Mirror Patch mode: source rows are the same rows, so the band has them
+            src_x = max(0, int(w - (x_start + width)))
+            patch = band_img.crop((src_x, row0 - band_top, src_x + width, row1 - band_top))
+            patch = patch.transpose(Image.FLIP_LEFT_RIGHT)
+            band_img.paste(patch, (x_start, row0 - band_top))
+            
+        elif wm_settings.get("use_patch", False):
+            # Manual Patch mode: source rows may live in another band, render just them
+            src_x = max(0, min(int(w * wm_settings["src_x"]), w - width))
+            src_y = max(0, min(int(h * wm_settings["src_y"]), h - height))
+            src_row0 = src_y + (row0 - y_start)
+            scale = 72.0 / dpi
+            with mupdf_lock:
+                src_rect = fitz.Rect(
+                    page.rect.x0 + src_x * scale, page.rect.y0 + src_row0 * scale,
+                    page.rect.x0 + (src_x + width) * scale, page.rect.y0 + (src_row0 + row1 - row0) * scale
+                )
+                pix = page.get_pixmap(dpi=dpi, clip=src_rect)
+                patch = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+            if patch.size != (width, row1 - row0):
+                patch = patch.resize((width, row1 - row0))
+            band_img.paste(patch, (x_start, row0 - band_top))
+        else:
+            # White mask mode
+            band_img.paste((255, 255, 255), (x_start, row0 - band_top, x_start + width, row1 - band_top))
+        
+        return band_img
+
+    def _downsample(self, img, src_dpi, dst_dpi):
+        """
+        Derives a lower-resolution raster from a high-DPI render instead of rendering again.
+        """
+        if dst_dpi >= src_dpi:
+            return img
+        factor = src_dpi / dst_dpi
+        if factor == int(factor):
+            return img.reduce(int(factor)) # Box filter over factor x factor pixel blocks
+        size = (max(1, round(img.width / factor)), max(1, round(img.height / factor)))
+        return img.resize(size, Image.BOX)
+
+    def _render_backgrounds(self, page_num, dpi=300, wm_settings=None, quality=80, derived_dpi=None, variant="background", encoder=None, wait=True):
+        """
+        Renders the cleaned background (see get_background_image) once as encoded tiles
+        and, if derived_dpi is set, also returns it downsampled to derived_dpi.
+        Oversized pages are rendered, patched and encoded band by band, so peak
+        memory stays bounded regardless of page size.
+        encoder: optional BackgroundEncoder of the output document (see src/encoder.py).
+        variant: "background" (text redacted) or "page" (text kept, for overlay mode).
+        Full-bleed image pages pass their embedded image through instead (see _passthrough_tiles).
+        wait=False returns as soon as the tiles are queued for encoding; pass them
+        through resolve_tiles before use.
+        Returns (tiles, derived PIL image or None); tiles are (image_bytes, ext, rect),
+        rect None for a single full-page tile.
         """
-        output_path = os.path.join(self.output_dir, f"{self.filename}_enhanced.pdf")
-        new_doc = fitz.open()
+        with mupdf_lock:
+            page = self.doc[page_num]
+            rect = page.rect
+        if encoder is None:
+            encoder = BackgroundEncoder("pdf", quality=quality)
+        passthrough = self._passthrough_tiles(page_num, dpi, wm_settings, variant)
+        if passthrough is not None:
+            tiles, img = passthrough
+            derived = None
+            if derived_dpi:
+                size = (max(1, round(rect.width * derived_dpi / 72.0)), max(1, round(rect.height * derived_dpi / 72.0)))
+                derived = img.resize(size, Image.BOX) if size[0] < img.width else img
+            return tiles, derived
+
+        dpi = min(dpi, self.page_dpi(page_num, variant))
+        with mupdf_lock:
+            needs_banding = self._needs_banding(page, dpi)
+        if not needs_banding:
+            if variant == "background":
+                bg_img = self.get_background_image(page_num, dpi=dpi, wm_settings=wm_settings)
+            else:
+                bg_img = self.clean_page_image(page_num, dpi=dpi, wm_settings=wm_settings)
+            derived = self._downsample(bg_img, dpi, derived_dpi) if derived_dpi else None
+            tiles = [(encoder.submit(bg_img), None, None)]
+            return (resolve_tiles(tiles) if wait else tiles), derived
         
-        # Verify font availability
+        tiles = []
+        derived = None
+        if derived_dpi:
+            # Assembled from downsampled bands, so the full-size raster never exists
+            derived_dpi = min(derived_dpi, dpi)
+            scale = derived_dpi / dpi
+            derived = Image.new("RGB", (
+                max(1, round(rect.width * derived_dpi / 72.0)),
+                max(1, round(rect.height * derived_dpi / 72.0))
+            ), "white")
+        if variant == "background":
+            doc_bg, page_bg = self._open_redacted_page(page_num)
+        else:
+            doc_bg, page_bg = None, page
         try:
-            test_page = new_doc.new_page()
-            test_page.insert_font(fontname="test_font", fontfile=self.font_path)
-        except Exception as e:
-            print(f"Error loading font {self.font_path}: {e}")
+            for band_rect, band_top, band_img in self._render_bands(page_bg, dpi):
+                band_img = self._apply_watermark_removal_band(band_img, band_top, page_bg, dpi, wm_settings)
+                if derived is not None:
+                    small = band_img.resize((derived.width, max(1, round(band_img.height * scale))), Image.BOX)
+                    derived.paste(small, (0, round(band_top * scale)))
+                tiles.append((encoder.submit(band_img), None, tuple(band_rect)))
+                # Bound the bands waiting for an encoder, so the full raster never piles up
+                if len(tiles) > encode_workers():
+                    tiles[-encode_workers() - 1][0].result()
         finally:
-            # Ensure the test page is removed regardless of success or failure
-            if len(new_doc) > 0:
-                new_doc.delete_page(0)
-        
-        total_pages = len(self.doc)
-        for page_num in range(total_pages):
+            if doc_bg is not None:
+                with mupdf_lock:
+                    doc_bg.close()
+        return (resolve_tiles(tiles) if wait else tiles), derived
+
+    def _background_encoder(self, target, page_nums, dpi, quality=80):
+        """
+        Creates the BackgroundEncoder for one output document; its byte budget
+        (Config.ENCODER_DOC_BUDGET_BYTES) is shared out by rendered page area.
+        """
+        total_pixels = 0
+        for page_num in page_nums:
+            rect = self.page_rect(page_num)
+            page_dpi = min(dpi, self.page_dpi(page_num, "background"))
+            total_pixels += rect.width * rect.height * (page_dpi / 72.0) ** 2
+        return BackgroundEncoder(target, quality=quality, total_pixels=total_pixels)
+
+    def _save_encoded_pages(self, checkpoint, pending, limit=0):
+        """
+        Checkpoints queued pages, oldest first, once their tiles are encoded.
+        pending: deque of (page_num, tiles, data); stops when at most limit are left,
+        so the next pages render while the last ones are still encoding.
+        """
+        while len(pending) > limit:
+            page_num, tiles, data = pending.popleft()
+            checkpoint.save_page(page_num, resolve_tiles(tiles), data)
+
+    def estimate_job(self, dpi=None, pages_to_remove=None, enable_ocr=False):
+        """
+        Rough cost and peak memory estimate used by the job scheduler.
+        Returns (cost, memory_bytes); cost is in rendered megapixels.
+        """
+        dpi = dpi or Config.DPI
+        cost = 0.0
+        peak_pixels = 0
+        for page_num in range(self.page_count):
             if pages_to_remove and page_num in pages_to_remove:
                 continue
+            rect = self.page_rect(page_num)
+            page_dpi = min(dpi, self.page_dpi(page_num, "background"))
+            pixels = rect.width * rect.height * (page_dpi / 72.0) ** 2
+            cost += pixels / 1e6
+            if pixels > Config.RENDER_BAND_THRESHOLD_PIXELS:
+                # Oversized pages are rendered in bands (see _render_backgrounds)
+                pixels = rect.width * page_dpi / 72.0 * Config.RENDER_BAND_HEIGHT
+            peak_pixels = max(peak_pixels, pixels)
+            
+            if enable_ocr and self.classify_page(page_num)["kind"] != "native":
+                # OCR inference costs roughly 10x rasterizing the same pixels
+                cost += 10 * rect.width * rect.height * (Config.OCR_DPI / 72.0) ** 2 / 1e6
+        
+        # RGB pixmap + PIL copy + encoder buffers for the largest page
+        memory_bytes = int(peak_pixels * 3 * 4)
+        return cost, memory_bytes
+
+    @property
+    def doc_hash(self):
+        """
+        SHA-256 of the source file, identifies the document across sessions and restarts.
+        """
+        if self._doc_hash is None:
+            h = hashlib.sha256()
+            with open(self.input_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(chunk)
+            self._doc_hash = h.hexdigest()
+        return self._doc_hash
+
+    @property
+    def doc_pool(self):
+        """
+        Pool of handles on the source (see DocumentPool). Rendering and
+        extraction borrow from it, so jobs and the preview can work on this
+        document from different threads; self.doc serves cheap metadata.
+        """
+        if self._doc_pool is None:
+            self._doc_pool = DocumentPool(self.input_path)
+        return self._doc_pool
+
+    def close(self):
+        """
+        Closes the document and its handle pool; the processor can't be used afterwards.
+        """
+        if self._doc_pool is not None:
+            self._doc_pool.close()
+        with mupdf_lock:
+            self.doc.close()
+
+    def page_rect(self, page_num):
+        """
+        Returns the rect of page_num, read under mupdf_lock (see docpool) so any thread may call it.
+        """
+        with mupdf_lock:
+            return self.doc[page_num].rect
+
+    def _open_checkpoint(self, kind, settings):
+        """
+        Opens and takes ownership of the checkpoint directory for a job on this document.
+        The directory is derived from the document hash, the job's settings, the
+        font and the Config.CHECKPOINT_KEY_SETTINGS, everything that changes the
+        per-page output, so only a rerun with the same inputs resumes.
+        While another running job owns it, the job gets a numbered sibling directory.
+        The caller releases (or removes) the checkpoint when done.
+        """
+        config = {name: getattr(Config, name) for name in Config.CHECKPOINT_KEY_SETTINGS}
+        job_id = make_job_id(JobCheckpoint.VERSION, self.doc_hash, kind, settings, self.font_path, config)
+        attempt = 0
+        while True:
+            name = f"job-{job_id}" if attempt == 0 else f"job-{job_id}-{attempt}"
+            checkpoint = JobCheckpoint(get_workspace_manager().workspace(name))
+            if checkpoint.acquire():
+                return checkpoint
+            attempt += 1
+
+    def _select_pages(self, pages=None, pages_to_remove=None):
+        """
+        Resolves the pages a job processes, in document order.
+        Returns (page_nums, name_suffix); the suffix marks a page-range fragment
+        (e.g. "_p1-40") so fragments of one document can be merged in order.
+        """
+        if pages is None:
+            candidates = range(self.page_count)
+            suffix = ""
+        else:
+            candidates = sorted(set(pages))
+            if not candidates or candidates[0] < 0 or candidates[-1] >= self.page_count:
+                raise ValueError(f"Page selection out of range (document has {self.page_count} pages)")
+            suffix = f"_p{candidates[0] + 1}-{candidates[-1] + 1}"
+        page_nums = [p for p in candidates if not (pages_to_remove and p in pages_to_remove)]
+        if not page_nums:
+            raise ValueError("No pages left to process")
+        return page_nums, suffix
+
+    def _layout_for_pdf(self, elements):
+        """
+        Prepares extracted elements for the PDF: one insert_text per line instead of per span.
+        """
+        if Config.LAYOUT_GROUPING:
+            return group_lines(elements)
+        return elements
+
+    def _layout_for_pptx(self, elements):
+        """
+        Prepares extracted elements for PPTX: standard font sizes, one text box per paragraph.
+        Works on copies, the input list is left untouched.
+        """
+        # Normalize font sizes to standard PPTX sizes
+        elements = self._normalize_font_sizes([dict(elem) for elem in elements])
+        if Config.LAYOUT_GROUPING:
+            return group_paragraphs(group_lines(elements))
+        return elements
+
+    def _run_checkpointed(self, kind, settings, page_nums, enable_ocr, process_pages, assemble):
+        """
+        Job flow shared by render_new_pdf, convert_to_pptx and render_outputs.
+        Opens the job's checkpoint (see _open_checkpoint), OCRs and processes only
+        the pages it doesn't hold yet with process_pages(checkpoint, todo), which
+        checkpoints every finished page, then builds the outputs from the
+        checkpointed pages with assemble(checkpoint). The checkpoint is removed once
+        assemble succeeds and released in any case, so an interrupted job resumes
+        where it stopped. Returns what assemble returns.
+        """
+        checkpoint = self._open_checkpoint(kind, settings)
+        try:
+            todo = [p for p in page_nums if not checkpoint.has_page(p)]
+            if enable_ocr:
+                self.prefetch_ocr(todo)
+            process_pages(checkpoint, todo)
+            result = assemble(checkpoint)
+            checkpoint.remove()
+        finally:
+            checkpoint.release()
+        return result
+
+    def render_new_pdf(self, wm_settings=None, debug_mode=False, enable_ocr=False, progress_callback=None, pages_to_remove=None, cancel_token=None, output_dir=None, pages=None):
+        """
+        Creates a new PDF with high-quality text and original background.
+        pages_to_remove: List of 0-based page numbers to skip.
+        pages: Optional list of 0-based page numbers to process (default: all).
+        A partial run is named after its range (see _select_pages), merge with src.merge.
+        cancel_token: Optional CancelToken, checked between pages.
+        output_dir: Optional directory for this output (defaults to self.output_dir).
+        Finished pages are checkpointed; an interrupted job resumes where it stopped.
+        """
+        total_pages = self.page_count
+        page_nums, suffix = self._select_pages(pages, pages_to_remove)
+        output_path = os.path.join(output_dir or self.output_dir, f"{self.filename}_enhanced{suffix}.pdf")
+        encoder = self._background_encoder("pdf", page_nums, Config.DPI)
+        page_index = {page_num: i for i, page_num in enumerate(page_nums)}
+
+        def process_pages(checkpoint, todo):
+            # Pages overlap in a pipeline (see src/pipeline.py): while page N renders,
+            # earlier pages are extracted/OCRed and encoded, and finished ones checkpointed
+            def render_page(page_num):
+                if progress_callback:
+                    progress_callback(page_index[page_num] / len(page_nums), f"Processing page {page_num + 1}/{total_pages}")
+
+                # 1. Get Background (Cleaned)
+                # Encoded in the background (palette PNG or JPEG q80, see src/encoder.py)
+                bg_tiles, _ = self._render_backgrounds(page_num, dpi=Config.DPI, wm_settings=wm_settings, quality=80, encoder=encoder, wait=False)
+                return bg_tiles, self.page_rect(page_num)
+
+            def process_page(page_num, rendered):
+                # 2. Get Text (page threads borrow a document handle, see doc_pool)
+                bg_tiles, rect = rendered
+                text_elements = self._layout_for_pdf(self.extract_elements(page_num, enable_ocr=enable_ocr))
+                return resolve_tiles(bg_tiles), {
+                    "width": rect.width,
+                    "height": rect.height,
+                    "elements": text_elements
+                }
+
+            def write_page(page_num, result):
+                # 3. Checkpoint the finished page
+                bg_tiles, data = result
+                checkpoint.save_page(page_num, bg_tiles, data)
+
+            pipeline = PagePipeline(render_page, process_page, write_page)
+            pipeline.run(todo, cancel_token=cancel_token)
+
+        def assemble(checkpoint):
+            # Assemble the output from the checkpointed pages
+            if progress_callback:
+                progress_callback(0.99, "Assembling PDF...")
+
+            self._write_pdf((checkpoint.load_page(p) for p in page_nums), output_path, debug_mode=debug_mode, wm_settings=wm_settings)
 
             if progress_callback:
-                progress_callback(page_num / total_pages, f"Processing page {page_num + 1}/{total_pages}")
+                progress_callback(1.0, "PDF generation complete!")
+
+        # Fragments get their own checkpoint directory, so one finishing can't remove another's pages
+        self._run_checkpointed(
+            "pdf", {"wm_settings": wm_settings, "enable_ocr": enable_ocr, "pages": page_nums if pages is not None else None},
+            page_nums, enable_ocr, process_pages, assemble
+        )
+        self._report_dpis(page_nums, Config.DPI)
+        encoder.report()
+        print(f"PDF saved to: {output_path}")
+        return output_path
+
+    def convert_to_pptx(self, wm_settings=None, text_mode="re-render", enable_ocr=False, progress_callback=None, pages_to_remove=None, cancel_token=None, output_dir=None, pages=None):
+        """
+        Converts the PDF to a PPTX file with editable text.
+        text_mode: 're-render' (clean bg + new text) or 'overlay' (original bg + invisible text)
+        pages_to_remove: List of 0-based page numbers to skip.
+        pages: Optional list of 0-based page numbers to process (default: all).
+        A partial run is named after its range (see _select_pages), merge with src.merge.
+        cancel_token: Optional CancelToken, checked between pages.
+        output_dir: Optional directory for this output (defaults to self.output_dir).
+        Finished pages are checkpointed; an interrupted job resumes where it stopped.
+        """
+        total_pages = self.page_count
+        page_nums, suffix = self._select_pages(pages, pages_to_remove)
+        output_path = os.path.join(output_dir or self.output_dir, f"{self.filename}{suffix}.pptx")
+        encoder = self._background_encoder("pptx", page_nums, Config.PPTX_DPI)
+        page_index = {page_num: i for i, page_num in enumerate(page_nums)}
 
-            # 1. Get Text
-            text_elements = self.extract_elements(page_num, enable_ocr=enable_ocr)
+        def process_pages(checkpoint, todo):
+            pending = collections.deque() # Pages whose background is still being encoded
+            for page_num in todo:
+                if cancel_token:
+                    cancel_token.raise_if_cancelled()
+
+                if progress_callback:
+                    progress_callback(page_index[page_num] / len(page_nums), f"Converting page {page_num + 1}/{total_pages}")
+
+                # 1. Get Background
+                # Use lower DPI for PPTX background to keep file light
+                # Overlay mode: Use original image (cleaned of watermark only)
+                # Re-render mode: Use redacted background (text removed)
+                bg_tiles, _ = self._render_backgrounds(
+                    page_num, dpi=Config.PPTX_DPI, wm_settings=wm_settings, quality=80,
+                    variant="page" if text_mode == "overlay" else "background", encoder=encoder, wait=False
+                )
             
-            # 2. Get Background (Cleaned)
-            # Use JPEG to reduce size significantly
-            bg_img = self.get_background_image(page_num, dpi=Config.DPI, wm_settings=wm_settings)
+                # 2. Get Text
+                text_elements = self._layout_for_pptx(self.extract_elements(page_num, enable_ocr=enable_ocr))
             
-            # Save bg to temp file to insert into PDF
-            # Use JPEG with quality 80
-            temp_bg_path = os.path.join(self.output_dir, f"temp_bg_{page_num}.jpg")
-            bg_img.save(temp_bg_path, "JPEG", quality=80, optimize=True)
+                if not text_elements:
+                    print(f"Warning: No text found on page {page_num}. PPTX slide will be image only.")
             
-            # 3. Create New Page
-            page = self.doc[page_num]
-            new_page = new_doc.new_page(width=page.rect.width, height=page.rect.height)
+                # 3. Checkpoint the finished page
+                pending.append((page_num, bg_tiles, {"elements": text_elements}))
+                self._save_encoded_pages(checkpoint, pending, encode_workers())
+            self._save_encoded_pages(checkpoint, pending)
+
+        def assemble(checkpoint):
+            # Assemble the output from the checkpointed pages
+            if progress_callback:
+                progress_callback(0.99, "Assembling PPTX...")
+
+            def load_slides():
+                for page_num in page_nums:
+                    bg_tiles, page_data = checkpoint.load_page(page_num)
+                    yield bg_tiles, page_data["elements"]
+
+            self._write_pptx(load_slides(), output_path, text_mode=text_mode)
+
+            if progress_callback:
+                progress_callback(1.0, "PPTX conversion complete!")
+
+        self._run_checkpointed(
+            "pptx", {"wm_settings": wm_settings, "text_mode": text_mode, "enable_ocr": enable_ocr, "pages": page_nums if pages is not None else None},
+            page_nums, enable_ocr, process_pages, assemble
+        )
+        self._report_dpis(page_nums, Config.PPTX_DPI, "page" if text_mode == "overlay" else "background")
+        encoder.report()
+        print(f"PPTX saved to: {output_path}")
+        return output_path
+
+    def render_outputs(self, formats=("pdf", "pptx"), wm_settings=None, debug_mode=False, enable_ocr=False, text_mode="re-render", progress_callback=None, pages_to_remove=None, cancel_token=None, output_dir=None, pages=None):
+        """
+        Produces several outputs in a single pass over the document.
+        formats: any of "pdf", "pptx" and "zip" (the PDF's background images, one per page).
+        Every page is extracted, OCRed, redacted and rendered once at Config.DPI; the
+        PPTX background is downsampled from that render instead of rendered again.
+        Other arguments as in render_new_pdf / convert_to_pptx.
+        Returns {format: output_path}.
+        """
+        unknown = set(formats) - {"pdf", "pptx", "zip"}
+        if unknown:
+            raise ValueError(f"Unknown output format(s): {', '.join(sorted(unknown))}")
+        common = dict(wm_settings=wm_settings, enable_ocr=enable_ocr, progress_callback=progress_callback,
+                      pages_to_remove=pages_to_remove, cancel_token=cancel_token, output_dir=output_dir, pages=pages)
+        # A single output has nothing to share
+        if set(formats) == {"pdf"}:
+            return {"pdf": self.render_new_pdf(debug_mode=debug_mode, **common)}
+        if set(formats) == {"pptx"}:
+            return {"pptx": self.convert_to_pptx(text_mode=text_mode, **common)}
+
+        output_dir = output_dir or self.output_dir
+        total_pages = self.page_count
+        page_nums, suffix = self._select_pages(pages, pages_to_remove)
+        want_pptx = "pptx" in formats
+        pdf_encoder = self._background_encoder("pdf", page_nums, Config.DPI)
+        pptx_encoder = self._background_encoder("pptx", page_nums, Config.PPTX_DPI)
+        page_index = {page_num: i for i, page_num in enumerate(page_nums)}
+
+        def process_pages(checkpoint, todo):
+            pending = collections.deque() # Pages whose backgrounds are still being encoded
+            for page_num in todo:
+                if cancel_token:
+                    cancel_token.raise_if_cancelled()
+
+                if progress_callback:
+                    progress_callback(page_index[page_num] / len(page_nums), f"Processing page {page_num + 1}/{total_pages}")
+
+                # 1. Get Text once, laid out for each output
+                elements = self.extract_elements(page_num, enable_ocr=enable_ocr)
+
+                # 2. Get Background once, the PPTX copy is derived from the high-DPI render
+                # (overlay mode keeps the text in the PPTX background, so that one is a separate render;
+                # image-only pages may pass their embedded image straight through to both outputs)
+                pptx_variant = "page" if text_mode == "overlay" else "background"
+                pptx_tiles = None
+                if want_pptx:
+                    passthrough = self._passthrough_tiles(page_num, Config.PPTX_DPI, wm_settings, pptx_variant)
+                    if passthrough is not None:
+                        pptx_tiles = passthrough[0]
+                shared = want_pptx and pptx_tiles is None and pptx_variant == "background"
+                bg_tiles, pptx_img = self._render_backgrounds(
+                    page_num, dpi=Config.DPI, wm_settings=wm_settings, quality=80, derived_dpi=Config.PPTX_DPI if shared else None,
+                    encoder=pdf_encoder, wait=False
+                )
+                if want_pptx and pptx_tiles is None:
+                    if shared:
+                        pptx_tiles = [(pptx_encoder.submit(pptx_img), None, None)]
+                    else:
+                        pptx_tiles, _ = self._render_backgrounds(
+                            page_num, dpi=Config.PPTX_DPI, wm_settings=wm_settings, quality=80, variant="page", encoder=pptx_encoder, wait=False
+                        )
+
+                tiles = list(bg_tiles) + (pptx_tiles or [])
+
+                # 3. Checkpoint the finished page
+                rect = self.page_rect(page_num)
+                pending.append((page_num, tiles, {
+                    "width": rect.width,
+                    "height": rect.height,
+                    "pdf_tiles": len(bg_tiles),
+                    "pdf_elements": self._layout_for_pdf(elements),
+                    "pptx_elements": self._layout_for_pptx(elements) if want_pptx else []
+                }))
+                self._save_encoded_pages(checkpoint, pending, encode_workers())
+            self._save_encoded_pages(checkpoint, pending)
+
+        def assemble(checkpoint):
+            # Assemble every output from the checkpointed pages
+            def load_pages():
+                for page_num in page_nums:
+                    tiles, page_data = checkpoint.load_page(page_num)
+                    yield page_num, tiles[:page_data["pdf_tiles"]], tiles[page_data["pdf_tiles"]:], page_data
+
+            outputs = {}
+            if "pdf" in formats:
+                if progress_callback:
+                    progress_callback(0.97, "Assembling PDF...")
+                outputs["pdf"] = os.path.join(output_dir, f"{self.filename}_enhanced{suffix}.pdf")
+                self._write_pdf(
+                    ((pdf_tiles, dict(page_data, elements=page_data["pdf_elements"])) for _, pdf_tiles, _, page_data in load_pages()),
+                    outputs["pdf"], debug_mode=debug_mode, wm_settings=wm_settings
+                )
+
+            if want_pptx:
+                if progress_callback:
+                    progress_callback(0.98, "Assembling PPTX...")
+                outputs["pptx"] = os.path.join(output_dir, f"{self.filename}{suffix}.pptx")
+                self._write_pptx(
+                    ((pptx_tiles, page_data["pptx_elements"]) for _, _, pptx_tiles, page_data in load_pages()),
+                    outputs["pptx"], text_mode=text_mode
+                )
+
+            if "zip" in formats:
+                if progress_callback:
+                    progress_callback(0.99, "Writing page images...")
+                outputs["zip"] = os.path.join(output_dir, f"{self.filename}_pages{suffix}.zip")
+                # JPEG/PNG don't compress any further, store them as they are
+                with zipfile.ZipFile(outputs["zip"], "w", zipfile.ZIP_STORED) as zf:
+                    for page_num, pdf_tiles, _, page_data in load_pages():
+                        if len(pdf_tiles) > 1 and pdf_tiles[0][1] is None:
+                            # Passthrough image with a watermark patch: flatten to one image
+                            pdf_tiles = [(self._flatten_tiles(pdf_tiles, page_data["width"], page_data["height"]), None)]
+                        for j, (tile_bytes, _) in enumerate(pdf_tiles):
+                            ext = "png" if tile_bytes[:4] == b"\x89PNG" else "jpg"
+                            name = f"page_{page_num + 1:03d}.{ext}" if len(pdf_tiles) == 1 else f"page_{page_num + 1:03d}_{j}.{ext}"
+                            zf.writestr(name, tile_bytes)
+
+            if progress_callback:
+                progress_callback(1.0, "All outputs complete!")
+            return outputs
+
+        outputs = self._run_checkpointed("multi", {
+            "formats": sorted(set(formats)), "wm_settings": wm_settings, "text_mode": text_mode, "enable_ocr": enable_ocr,
+            "pages": page_nums if pages is not None else None
+        }, page_nums, enable_ocr, process_pages, assemble)
+        self._report_dpis(page_nums, Config.DPI)
+        pdf_encoder.report()
+        pptx_encoder.report()
+        for fmt, path in outputs.items():
+            print(f"{fmt.upper()} saved to: {path}")
+        return outputs
+
+    def _flatten_tiles(self, tiles, width, height):
+        """
+        Pastes positioned tiles onto the full-page first tile and re-encodes it in its format.
+        """
+        base = Image.open(io.BytesIO(tiles[0][0]))
+        fmt = base.format
+        base = base.convert("RGB")
+        sx = base.width / width
+        sy = base.height / height
+        for tile_bytes, rect in tiles[1:]:
+            tile = Image.open(io.BytesIO(tile_bytes)).convert("RGB")
+            base.paste(tile, (int(round(rect[0] * sx)), int(round(rect[1] * sy))))
+        buf = io.BytesIO()
+        base.save(buf, fmt, quality=90) if fmt == "JPEG" else base.save(buf, fmt)
+        return buf.getvalue()
+
+    def _resolve_font(self, font_path=None):
+        """
+        Resolves the font for generated text once per document: font_path, then
+        the processor's font, then Config.CJK_FONT_FALLBACK, then the built-in
+        Helvetica. Font files are loaded once per process (see load_font).
+        Returns {"fontname", "buffer" (None for Helvetica), "font" (fitz.Font for measuring)}.
+        """
+        key = font_path or self.font_path
+        with self._lock:
+            if key in self._fonts:
+                return self._fonts[key]
+
+        font = None
+        for path in (font_path, self.font_path, Config.CJK_FONT_FALLBACK):
+            if not path or not os.path.exists(path):
+                continue
+            try:
+                font = load_font(path)
+                break
+            except Exception as e:
+                print(f"Error loading font {path}: {e}")
+        if font is None:
+            print("Warning: No usable font file found, generated text uses Helvetica.")
+            with mupdf_lock:
+                font = {"fontname": "helv", "buffer": None, "font": fitz.Font("helv")}
+
+        with self._lock:
+            self._fonts[key] = font
+        return font
+
+    def _register_font(self, page, font, font_xrefs):
+        """
+        Makes a font from _resolve_font available on page under font["fontname"].
+        It is embedded on the first page of a document; later pages only reference
+        that xref. font_xrefs: fontname -> xref, one dict per output document.
+        """
+        fontname = font["fontname"]
+        if font["buffer"] is None:
+            page.insert_font(fontname=fontname) # Base-14, nothing to embed
+        elif fontname in font_xrefs:
+            # Add "/fontname xref 0 R" to the page's font resources, following indirect dicts
+            doc = page.parent
+            xref, path = page.xref, ""
+            for key in ("Resources", "Font"):
+                path = f"{path}/{key}" if path else key
+                kind, value = doc.xref_get_key(xref, path)
+                if kind == "xref":
+                    xref, path = int(value.split()[0]), ""
+            doc.xref_set_key(xref, f"{path}/{fontname}" if path else fontname, f"{font_xrefs[fontname]} 0 R")
+        else:
+            font_xrefs[fontname] = page.insert_font(fontname=fontname, fontbuffer=font["buffer"])
+
+    def _subset_fonts(self, doc):
+        """
+        Reduces the embedded fonts of a generated document to the glyphs it uses.
+        """
+        if not Config.FONT_SUBSET:
+            return
+        try:
+            doc.subset_fonts()
+        except Exception as e:
+            print(f"Warning: Font subsetting failed, fonts stay fully embedded: {e}")
+
+    def _write_pdf(self, pages, output_path, debug_mode=False, wm_settings=None):
+        """
+        Writes the enhanced PDF.
+        pages: iterable of (bg_tiles, page_data) as returned by JobCheckpoint.load_page,
+        page_data holding the page width, height and text elements.
+        """
+        with mupdf_lock:
+            new_doc = fitz.open()
+        font = self._resolve_font()
+        text_bg = bool(wm_settings and wm_settings.get("text_bg", False))
+        
+        image_xrefs = {} # Image hash -> xref, pages with the same background share one image
+        for bg_tiles, page_data in pages:
+            text_elements = page_data["elements"]
             
-            # 4. Insert Background
-            new_page.insert_image(new_page.rect, filename=temp_bg_path)
+            # MuPDF work for one page; other jobs can render between pages
+            with mupdf_lock:
+                # 4. Create New Page
+                new_page = new_doc.new_page(width=page_data["width"], height=page_data["height"])
             
-            # 5. Insert Text
-            fontname = "custom_font"
-            try:
-                new_page.insert_font(fontname=fontname, fontfile=self.font_path)
-            except Exception:
-                # If font fails, it might use default.
-                pass
+                # 5. Insert Background (one image, or one per band for oversized pages)
+                for tile_bytes, tile_rect in bg_tiles:
+                    rect = fitz.Rect(tile_rect) if tile_rect else new_page.rect
+                    key = hashlib.sha256(tile_bytes).hexdigest()
+                    # Fill the rect exactly, whole pixel rows don't always match its aspect ratio
+                    if key in image_xrefs:
+                        new_page.insert_image(rect, xref=image_xrefs[key], keep_proportion=False)
+                    else:
+                        image_xrefs[key] = new_page.insert_image(rect, stream=tile_bytes, keep_proportion=False)
             
-            for elem in text_elements:
-                hex_color = elem["color"]
-                if hex_color.startswith("#"):
-                    hex_color = hex_color[1:]
+                # 6. Insert Text
+                # Batched per page: one shape for all cover boxes, one TextWriter per text color
+                # (a TextWriter writes all its text in one color)
+                shape = new_page.new_shape() if text_bg and text_elements else None
+                writers = {}
+                for elem in text_elements:
+                    hex_color = elem["color"]
+                    if hex_color.startswith("#"):
+                        hex_color = hex_color[1:]
                 
-                try:
-                    r = int(hex_color[0:2], 16) / 255.0
-                    g = int(hex_color[2:4], 16) / 255.0
-                    b = int(hex_color[4:6], 16) / 255.0
-                except ValueError:
-                    r, g, b = 0, 0, 0
+                    try:
+                        r = int(hex_color[0:2], 16) / 255.0
+                        g = int(hex_color[2:4], 16) / 255.0
+                        b = int(hex_color[4:6], 16) / 255.0
+                    except ValueError:
+                        r, g, b = 0, 0, 0
                 
-                # Debug Mode: Force Red Color
-                if debug_mode:
-                    r, g, b = (1, 0, 0)
+                    # Debug Mode: Force Red Color
+                    if debug_mode:
+                        r, g, b = (1, 0, 0)
                 
-                # Draw Text Background (to cover old blurry text)
-                # We use a simple white box for now. 
-                # Ideally we could pick the average color of the background in that rect.
-                if wm_settings and wm_settings.get("text_bg", False):
-                    # Draw a filled rectangle
-                    # bbox is (x0, y0, x1, y1)
-                    rect = fitz.Rect(elem["bbox"])
-                    # Add a small padding
-                    rect.x0 -= 1
-                    rect.y0 -= 1
-                    rect.x1 += 1
-                    rect.y1 += 1
-                    
-                    # Draw white box
-                    shape = new_page.new_shape()
-                    shape.draw_rect(rect)
-                    shape.finish(color=None, fill=(1, 1, 1)) # White fill, no border
-                    shape.commit()
+                    # Draw Text Background (to cover old blurry text)
+                    # We use a simple white box for now. 
+                    # Ideally we could pick the average color of the background in that rect.
+                    if shape is not None:
+                        # bbox is (x0, y0, x1, y1), add a small padding
+                        rect = fitz.Rect(elem["bbox"])
+                        rect.x0 -= 1
+                        rect.y0 -= 1
+                        rect.x1 += 1
+                        rect.y1 += 1
+                        shape.draw_rect(rect)
 
-                new_page.insert_text(
-                    elem["origin"],
-                    elem["text"],
-                    fontname=fontname,
-                    fontsize=elem["size"],
-                    color=(r, g, b)
-                )
-            
-            # Cleanup temp file
-            if os.path.exists(temp_bg_path):
-                os.remove(temp_bg_path)
-        
-        if progress_callback:
-            progress_callback(1.0, "PDF generation complete!")
+                    if (r, g, b) not in writers:
+                        writers[(r, g, b)] = fitz.TextWriter(new_page.rect)
+                    writers[(r, g, b)].append(elem["origin"], elem["text"], font=font["font"], fontsize=elem["size"])
 
-        new_doc.save(output_path)
-        print(f"PDF saved to: {output_path}")
-        return output_path
+                if shape is not None:
+                    # White boxes, no border, under the text
+                    shape.finish(color=None, fill=(1, 1, 1))
+                    shape.commit()
+                for color, writer in writers.items():
+                    writer.write_text(new_page, color=color)
+
+        with mupdf_lock:
+            self._subset_fonts(new_doc)
+            # PNG backgrounds are stored as raw pixels until deflated
+            new_doc.save(output_path, deflate=True)
+            new_doc.close()
 
-    def convert_to_pptx(self, wm_settings=None, text_mode="re-render", enable_ocr=False, progress_callback=None, pages_to_remove=None):
+    def _write_pptx(self, pages, output_path, text_mode="re-render"):
         """
-        Converts the PDF to a PPTX file with editable text.
-        text_mode: 're-render' (clean bg + new text) or 'overlay' (original bg + invisible text)
-        pages_to_remove: List of 0-based page numbers to skip.
+        Writes the PPTX.
+        pages: iterable of (bg_tiles, text_elements), one per slide; bg_tiles are
+        (image_bytes, rect) pairs, rect None for the full-slide background.
         """
-        output_path = os.path.join(self.output_dir, f"{self.filename}.pptx")
+        # python-pptx is only needed here, keep it off the startup path
+        from pptx import Presentation
+        from .pptx_writer import add_textboxes
+
         prs = Presentation()
         
-        first_page = self.doc[0]
+        first_rect = self.page_rect(0)
         # PPTX uses EMU (English Metric Unit). 1 point = 12700 EMUs.
         # Ensure we don't overflow or create tiny slides.
-        prs.slide_width = int(first_page.rect.width * 12700)
-        prs.slide_height = int(first_page.rect.height * 12700)
+        prs.slide_width = int(first_rect.width * 12700)
+        prs.slide_height = int(first_rect.height * 12700)
         
-        total_pages = len(self.doc)
-        for page_num in range(total_pages):
-            if pages_to_remove and page_num in pages_to_remove:
-                continue
-
-            if progress_callback:
-                progress_callback(page_num / total_pages, f"Converting page {page_num + 1}/{total_pages}")
-
-            # 1. Get Background
-            # Use lower DPI for PPTX background to keep file light
-            if text_mode == "overlay":
-                # Overlay mode: Use original image (cleaned of watermark only)
-                bg_img = self.clean_page_image(page_num, dpi=150, wm_settings=wm_settings)
-            else:
-                # Re-render mode: Use redacted background (text removed)
-                bg_img = self.get_background_image(page_num, dpi=150, wm_settings=wm_settings) 
-                
-            temp_bg_path = os.path.join(self.output_dir, f"temp_bg_pptx_{page_num}.jpg")
-            bg_img.save(temp_bg_path, "JPEG", quality=80)
-            
-            # 2. Add Slide
+        for bg_tiles, text_elements in pages:
+            # 4. Add Slide
             blank_slide_layout = prs.slide_layouts[6] 
             slide = prs.slides.add_slide(blank_slide_layout)
             
-            # 3. Set Background
-            left = top = 0
-            pic = slide.shapes.add_picture(temp_bg_path, left, top, width=prs.slide_width, height=prs.slide_height)
-            
-            # 4. Add Text Boxes
-            text_elements = self.extract_elements(page_num, enable_ocr=enable_ocr)
-            
-            # Normalize font sizes to standard PPTX sizes
-            text_elements = self._normalize_font_sizes(text_elements)
-            
-            if not text_elements:
-                print(f"Warning: No text found on page {page_num}. PPTX slide will be image only.")
+            # 5. Set Background (plus positioned tiles: bands or a watermark patch)
+            # python-pptx stores identical image bytes as one media part, shared by all slides
+            for tile_bytes, tile_rect in bg_tiles:
+                if tile_rect is None:
+                    left = top = 0
+                    slide.shapes.add_picture(io.BytesIO(tile_bytes), left, top, width=prs.slide_width, height=prs.slide_height)
+                else:
+                    x0, y0, x1, y1 = tile_rect
+                    slide.shapes.add_picture(
+                        io.BytesIO(tile_bytes), int(x0 * 12700), int(y0 * 12700), width=int((x1 - x0) * 12700), height=int((y1 - y0) * 12700)
+                    )
             
+            # 6. Add Text Boxes (built as XML and appended in one go, see pptx_writer)
+            boxes = []
             for elem in text_elements:
                 x, y, x1, y1 = elem["bbox"]
                 w = x1 - x
@@ -451,23 +1603,9 @@ class PDFProcessor:
                 if w < 1 or h < 1:
                     continue
 
-                # Add text box
-                txBox = slide.shapes.add_textbox(Pt(x), Pt(y), Pt(w), Pt(h))
-                tf = txBox.text_frame
-                tf.word_wrap = True 
-                
-                p = tf.paragraphs[0]
-                p.text = "" # Clear paragraph text
-                run = p.add_run()
-                run.text = elem["text"]
-                run.font.size = Pt(elem["size"])
-                run.font.name = "Microsoft JhengHei"
-                
                 if text_mode == "overlay":
-                    # Overlay mode: Invisible text
-                    # Set color to black but fully transparent
-                    # NOTE: We use background() to set "No Fill", making text invisible.
-                    run.font.fill.background() 
+                    # Overlay mode: Invisible text ("No Fill")
+                    color = None
                 else:
                     # Re-render mode: Visible colored text
                     hex_color = elem["color"]
@@ -480,10 +1618,17 @@ class PDFProcessor:
                         b = int(hex_color[4:6], 16)
                     except ValueError:
                         r, g, b = 0, 0, 0 # Fallback to black
+                    color = "{:02X}{:02X}{:02X}".format(r, g, b)
 
-                    run.font.color.rgb = RGBColor(r, g, b)
+                boxes.append({
+                    "x": x, "y": y, "w": w, "h": h,
+                    "text": elem["text"],
+                    "size": elem["size"],
+                    "color": color
+                })
+            add_textboxes(slide, boxes, font_name="Microsoft JhengHei")
 
-            # 5. Add Notes (Speaker Notes)
+            # 7. Add Notes (Speaker Notes)
             if text_elements:
                 # Combine all text into a single string
                 notes_text = "\n".join([elem["text"] for elem in text_elements])
@@ -493,16 +1638,7 @@ class PDFProcessor:
                 text_frame = notes_slide.notes_text_frame
                 text_frame.text = notes_text
 
-            # Cleanup
-            if os.path.exists(temp_bg_path):
-                os.remove(temp_bg_path)
-        
-        if progress_callback:
-            progress_callback(1.0, "PPTX conversion complete!")
-            
         prs.save(output_path)
-        print(f"PPTX saved to: {output_path}")
-        return output_path
 
     def extract_text_data(self, pages=None, progress_callback=None):
         """
@@ -516,14 +1652,15 @@ class PDFProcessor:
             # Convert 1-based to 0-based
             pages_to_process = [p - 1 for p in pages]
         else:
-            pages_to_process = range(len(self.doc))
+            pages_to_process = range(self.page_count)
             
         total_pages = len(pages_to_process)
+        self.prefetch_ocr([p for p in pages_to_process if 0 <= p < self.page_count])
         for idx, page_num in enumerate(pages_to_process):
             if progress_callback:
                 progress_callback(idx / total_pages, f"Analyzing page {page_num + 1}")
 
-            if page_num < 0 or page_num >= len(self.doc):
+            if page_num < 0 or page_num >= self.page_count:
                 continue
                 
             elements = self.extract_elements(page_num, enable_ocr=True)
@@ -747,13 +1884,12 @@ class PDFProcessor:
         Processes background regions for text replacement.
         mode: 'Blur', 'Smart Fill', 'White'
         """
-        page = self.doc[page_num]
-        pix = page.get_pixmap(dpi=dpi)
-        img = Image.open(io.BytesIO(pix.tobytes()))
+        rect = self.page_rect(page_num)
+        img = self.page_raster(page_num, dpi)
         
         w, h = img.size
-        scale_x = w / page.rect.width
-        scale_y = h / page.rect.height
+        scale_x = w / rect.width
+        scale_y = h / rect.height
         
         for bbox in text_bboxes:
             # Scale bbox to image coordinates
@@ -812,14 +1948,16 @@ class PDFProcessor:
             
         return img
 
-    def apply_text_edits(self, edits_data, font_path=None, wm_settings=None, bg_mode='Blur'):
+    def apply_text_edits(self, edits_data, font_path=None, wm_settings=None, bg_mode='Blur', output_dir=None):
         """
         Applies text edits to the PDF.
         edits_data: List of dicts (from st.data_editor)
         wm_settings: Watermark settings to apply to background.
         bg_mode: 'Blur', 'Smart Fill', 'White'
+        output_dir: Optional directory for this output (defaults to self.output_dir).
         """
-        output_path = os.path.join(self.output_dir, f"{self.filename}_edited.pdf")
+        output_dir = output_dir or self.output_dir
+        output_path = os.path.join(output_dir, f"{self.filename}_edited.pdf")
         
         # Group edits by page
         edits_by_page = {}
@@ -830,26 +1968,27 @@ class PDFProcessor:
             edits_by_page[page_num].append(item)
             
         # Use a temporary PDF to build the new one
-        new_doc = fitz.open()
-        
-        # Font handling
-        fontname = "cjk"
-        use_font_path = font_path or self.font_path
+        with mupdf_lock:
+            new_doc = fitz.open()
         
-        # Create font object for measuring text width
-        try:
-            measure_font = fitz.Font(fontfile=use_font_path)
-        except:
-            measure_font = fitz.Font("helv") # Fallback
+        # Font handling: resolved and loaded once, also used for measuring text width
+        font = self._resolve_font(font_path)
+        fontname = font["fontname"]
+        measure_font = font["font"]
+        font_xrefs = {}
+
+        edited_pages = [page_num for page_num in range(self.page_count) if (page_num + 1) in edits_by_page]
+        encoder = self._background_encoder("pdf", edited_pages, Config.DPI, quality=85)
         
         # Process each page of the ORIGINAL document
-        for page_num in range(len(self.doc)):
-            original_page = self.doc[page_num]
+        for page_num in range(self.page_count):
+            original_rect = self.page_rect(page_num)
             
             # Check if this page is in our edits data
             if (page_num + 1) not in edits_by_page:
                 # Page was not selected for editing/analysis. Copy original.
-                new_doc.insert_pdf(self.doc, from_page=page_num, to_page=page_num)
+                with mupdf_lock:
+                    new_doc.insert_pdf(self.doc, from_page=page_num, to_page=page_num)
                 continue
             
             # Identify modified items for this page
@@ -868,7 +2007,8 @@ class PDFProcessor:
                     
                     # Calculate new text dimensions
                     try:
-                        new_text_width = measure_font.text_length(new_text, fontsize=font_size)
+                        with mupdf_lock:
+                            new_text_width = measure_font.text_length(new_text, fontsize=font_size)
                     except:
                         new_text_width = (len(new_text) * font_size) # Rough fallback
                         
@@ -902,83 +2042,66 @@ class PDFProcessor:
                 bg_img = self.process_background_regions(page_num, bboxes_to_blur, dpi=Config.DPI, padding=5, mode=bg_mode)
             else:
                 # No edits for this page, just render standard background
-                pix = original_page.get_pixmap(dpi=Config.DPI)
-                bg_img = Image.open(io.BytesIO(pix.tobytes()))
+                bg_img = self.page_raster(page_num, Config.DPI)
 
             # Apply Watermark Removal if requested
             if wm_settings:
                 bg_img = self._apply_watermark_removal(bg_img, wm_settings)
 
-            # Save bg to temp
-            temp_bg_path = os.path.join(self.output_dir, f"temp_bg_edit_{page_num}.jpg")
-            bg_img.save(temp_bg_path, "JPEG", quality=85)
+            # Encode bg (palette PNG or JPEG q85, see src/encoder.py)
+            bg_bytes, _ = encoder.encode(bg_img)
             
-            # 2. Create New Page
-            new_page = new_doc.new_page(width=original_page.rect.width, height=original_page.rect.height)
+            # MuPDF work for one page; other jobs can render between pages
+            with mupdf_lock:
+                # 2. Create New Page
+                new_page = new_doc.new_page(width=original_rect.width, height=original_rect.height)
             
-            # 3. Insert Background
-            new_page.insert_image(new_page.rect, filename=temp_bg_path)
+                # 3. Insert Background
+                new_page.insert_image(new_page.rect, stream=bg_bytes)
             
-            # 4. Insert Text (Iterate ALL items to ensure copyability)
-            if page_edits:
-                # Register font
-                try:
-                    new_page.insert_font(fontname=fontname, fontfile=use_font_path)
-                except Exception:
-                    pass
+                # 4. Insert Text (Iterate ALL items to ensure copyability)
+                if page_edits:
+                    # Register font
+                    self._register_font(new_page, font, font_xrefs)
                 
-                for item in page_edits:
-                    # Check if this item is modified
-                    is_modified = item in modified_items
-                    
-                    # Parse Hex color
-                    hex_color = item["color"]
-                    if hex_color.startswith("#"):
-                        hex_color = hex_color[1:]
-                    try:
-                        r = int(hex_color[0:2], 16) / 255.0
-                        g = int(hex_color[2:4], 16) / 255.0
-                        b = int(hex_color[4:6], 16) / 255.0
-                    except:
-                        r, g, b = 0, 0, 0 # Fallback to black
-                    
-                    if is_modified:
-                        # Modified: Render Visible Text
-                        render_mode = 0 # Fill
-                        text_content = item["new_text"]
-                    else:
-                        # Unmodified: Render Invisible Text (for copyability)
-                        render_mode = 3 # Invisible
-                        text_content = item["original_text"] # Use original text
+                    for item in page_edits:
+                        # Check if this item is modified
+                        is_modified = item in modified_items
                     
-                    # Font handling for insert_text
-                    insert_font_args = {"fontname": "helv", "fontsize": item["size"]}
+                        # Parse Hex color
+                        hex_color = item["color"]
+                        if hex_color.startswith("#"):
+                            hex_color = hex_color[1:]
+                        try:
+                            r = int(hex_color[0:2], 16) / 255.0
+                            g = int(hex_color[2:4], 16) / 255.0
+                            b = int(hex_color[4:6], 16) / 255.0
+                        except:
+                            r, g, b = 0, 0, 0 # Fallback to black
                     
-                    if use_font_path and os.path.exists(use_font_path):
-                        insert_font_args["fontname"] = "custom_font"
-                        insert_font_args["fontfile"] = use_font_path
-                    else:
-                        # Try to find Noto Sans CJK on Linux/Cloud
-                        noto_path = "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc"
-                        if os.path.exists(noto_path):
-                             insert_font_args["fontname"] = "noto_cjk"
-                             insert_font_args["fontfile"] = noto_path
+                        if is_modified:
+                            # Modified: Render Visible Text
+                            render_mode = 0 # Fill
+                            text_content = item["new_text"]
                         else:
-                            # Fallback to helv, no fontfile arg needed
-                            pass
-
-                    # Insert text
-                    new_page.insert_text(
-                        item["origin"],
-                        text_content,
-                        color=(r, g, b),
-                        render_mode=render_mode,
-                        **insert_font_args
-                    )
-            
-            # Cleanup
-            if os.path.exists(temp_bg_path):
-                os.remove(temp_bg_path)
+                            # Unmodified: Render Invisible Text (for copyability)
+                            render_mode = 3 # Invisible
+                            text_content = item["original_text"] # Use original text
+                    
+                        # Insert text
+                        new_page.insert_text(
+                            item["origin"],
+                            text_content,
+                            fontname=fontname,
+                            fontsize=item["size"],
+                            color=(r, g, b),
+                            render_mode=render_mode
+                        )
+        
         
-        new_doc.save(output_path)
+        with mupdf_lock:
+            self._subset_fonts(new_doc)
+            # PNG backgrounds are stored as raw pixels until deflated
+            new_doc.save(output_path, deflate=True)
+            new_doc.close()
         return output_path
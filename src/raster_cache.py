@@ -0,0 +1,111 @@
+import collections
+import threading
+
+from PIL import Image
+
+from .config import Config
+
+
+class RasterPyramidCache:
+    """
+    Process-wide LRU of per-page resolution pyramids.
+    A page is rendered once at the highest DPI requested so far (at most the base
+    DPI); the lower levels (top/2, top/4, ...) are derived with area downsampling and
+    cached together with it. Any DPI up to the top is then served from the nearest
+    level above it, without going back to the page's content stream. A sharper
+    request renders the page again and replaces the pyramid, so consumers that
+    only need low resolutions (previews, OCR, PPTX) never pay for a base-DPI render.
+    Entries are keyed by (doc_hash, page_num, variant), where variant names what was
+    rendered, e.g. "page" (the page as is) or "background" (text redacted); pyramids
+    pinned to one render resolution add that DPI to the key (see PDFProcessor.page_raster).
+    """
+
+    def __init__(self, max_bytes=None, base_dpi=None):
+        self.max_bytes = max_bytes or Config.RASTER_CACHE_MAX_BYTES
+        self.base_dpi = base_dpi or Config.PYRAMID_BASE_DPI
+
+        self._pyramids = collections.OrderedDict() # key -> [(dpi, image)], largest first
+        self._sizes = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def _build_levels(self, base_img, base_dpi):
+        levels = [(base_dpi, base_img)]
+        dpi, img = base_dpi, base_img
+        while dpi / 2 >= Config.PYRAMID_MIN_DPI and min(img.size) >= 2:
+            img = img.reduce(2) # Box filter over 2x2 pixel blocks
+            dpi = dpi / 2
+            levels.append((dpi, img))
+        return levels
+
+    def _lookup(self, key):
+        with self._lock:
+            levels = self._pyramids.get(key)
+            if levels is not None:
+                self._pyramids.move_to_end(key)
+            return levels
+
+    def _store(self, key, levels):
+        size = sum(img.width * img.height * len(img.getbands()) for _, img in levels)
+        if size > self.max_bytes:
+            return # Would evict everything else and still not fit
+        with self._lock:
+            if key in self._pyramids:
+                if self._pyramids[key][0][0] >= levels[0][0]:
+                    return # Another thread built one at least as sharp meanwhile
+                del self._pyramids[key]
+                self._total_bytes -= self._sizes.pop(key)
+            self._pyramids[key] = levels
+            self._sizes[key] = size
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                old_key, _ = self._pyramids.popitem(last=False)
+                self._total_bytes -= self._sizes.pop(old_key)
+
+    def _from_levels(self, levels, dpi):
+        # Smallest level that is at least as sharp as requested
+        level_dpi, level_img = next((d, img) for d, img in reversed(levels) if d >= dpi)
+        if level_dpi == dpi:
+            return level_img.copy() # Callers may draw on the image
+        scale = dpi / level_dpi
+        size = (max(1, round(level_img.width * scale)), max(1, round(level_img.height * scale)))
+        return level_img.resize(size, Image.BOX)
+
+    def get(self, key, dpi, render, build=True, base_dpi=None):
+        """
+        Returns the page raster for key at dpi as a new PIL image.
+        render(dpi) renders the page at the given DPI. Without a pyramid at least as
+        sharp as dpi it is called at dpi, and the pyramid is (re)built from that
+        render; if dpi is above the base or the pyramid may not be built (build=False,
+        e.g. cheap thumbnails) the render is returned without caching it.
+        base_dpi: optional lower base for this page (e.g. its native image resolution).
+        """
+        base_dpi = min(base_dpi or self.base_dpi, self.base_dpi)
+        if dpi <= base_dpi:
+            levels = self._lookup(key)
+            if levels is not None and levels[0][0] >= dpi:
+                return self._from_levels(levels, dpi)
+            if build:
+                levels = self._build_levels(render(dpi), dpi)
+                self._store(key, levels)
+                return self._from_levels(levels, dpi)
+        return render(dpi)
+
+    def stats(self):
+        with self._lock:
+            return {"pyramids": len(self._pyramids), "bytes": self._total_bytes}
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_raster_cache():
+    """
+    Returns the process-wide RasterPyramidCache.
+    """
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = RasterPyramidCache()
+        return _shared_cache
@@ -0,0 +1,202 @@
+import threading
+import time
+import traceback
+import uuid
+
+from .config import Config
+from .jobs import CancelToken, JobCancelled
+
+# Job priorities, higher runs first
+PRIORITY_BACKGROUND = 0 # Speculative work, yields to everything else
+PRIORITY_NORMAL = 1
+
+
+class Job:
+    """
+    A unit of work run by the JobScheduler.
+    func is called as func(job); use job.update_progress as the progress_callback
+    and job.cancel_token as the cancel_token of the processor methods.
+    Once the job finishes func is dropped, so whatever it holds (e.g. a
+    processor and its document) isn't kept alive with the job's status.
+    """
+
+    def __init__(self, func, cost=1.0, memory_bytes=0, name="", priority=PRIORITY_NORMAL):
+        self.id = uuid.uuid4().hex
+        self.func = func
+        self.cost = cost
+        self.memory_bytes = memory_bytes
+        self.name = name
+        self.priority = priority
+
+        self.status = "queued" # queued, running, done, failed, cancelled
+        self.cancel_token = CancelToken()
+        self.progress = 0.0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.traceback = None
+
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._finished = threading.Event()
+
+    def update_progress(self, progress, message=""):
+        self.progress = progress
+        self.message = message
+
+    def cancel(self):
+        self.cancel_token.cancel()
+
+    @property
+    def done(self):
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the job finishes. Returns True if it did within timeout.
+        """
+        return self._finished.wait(timeout)
+
+
+class JobScheduler:
+    """
+    Process-wide scheduler with a bounded worker pool shared by every session.
+    Queued jobs run by priority, then shortest-job-first, and a job only starts
+    when its memory estimate fits into what the running jobs leave of the memory budget.
+    Background jobs (PRIORITY_BACKGROUND) only start while nothing else is waiting,
+    use at most Config.BACKGROUND_MAX_JOBS workers, and are cancelled as soon as
+    another job can't start because of them; they must be safe to cancel at any point.
+    """
+
+    def __init__(self, max_workers=None, memory_budget=None):
+        self.max_workers = max_workers or Config.MAX_CONCURRENT_JOBS
+        self.memory_budget = memory_budget or Config.JOB_MEMORY_BUDGET_BYTES
+
+        self._queue = []
+        self._running = []
+        self._cond = threading.Condition()
+
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+
+    def submit(self, func, cost=1.0, memory_bytes=0, name="", priority=PRIORITY_NORMAL):
+        job = Job(func, cost=cost, memory_bytes=memory_bytes, name=name, priority=priority)
+        with self._cond:
+            self._queue.append(job)
+            if priority > PRIORITY_BACKGROUND:
+                self._preempt_background(job)
+            self._cond.notify_all()
+        return job
+
+    def _preempt_background(self, job):
+        # Caller holds self._cond. Cancels running background jobs if job can't start next to them.
+        background = [running for running in self._running if running.priority <= PRIORITY_BACKGROUND]
+        if not background:
+            return
+        memory_in_use = sum(running.memory_bytes for running in self._running)
+        if len(self._running) >= self.max_workers or memory_in_use + job.memory_bytes > self.memory_budget:
+            for running in background:
+                running.cancel()
+
+    def cancel(self, job):
+        """
+        Cancels a job. Queued jobs are dropped at once; running jobs stop at
+        their next cancel_token check (their checkpoints are kept for resuming).
+        """
+        job.cancel()
+        with self._cond:
+            if job not in self._queue:
+                return
+            self._queue.remove(job)
+        job.status = "cancelled"
+        job.finished_at = time.time()
+        job.func = None
+        job._finished.set()
+
+    def _order_key(self, job, now):
+        # Priority first, then shortest job first, with aging so a big job can't starve forever
+        waited = now - job.submitted_at
+        return (-job.priority, job.cost / (1.0 + waited / Config.JOB_AGING_SECONDS))
+
+    def _ordered_queue(self):
+        now = time.time()
+        return sorted(self._queue, key=lambda job: self._order_key(job, now))
+
+    def position(self, job):
+        """
+        1-based queue position of a waiting job, 0 once it is running or finished.
+        """
+        with self._cond:
+            if job not in self._queue:
+                return 0
+            return self._ordered_queue().index(job) + 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": len(self._queue),
+                "running": len(self._running),
+                "memory_in_use": sum(job.memory_bytes for job in self._running)
+            }
+
+    def _next_job(self):
+        # Caller holds self._cond
+        memory_in_use = sum(job.memory_bytes for job in self._running)
+        foreground_waiting = any(job.priority > PRIORITY_BACKGROUND for job in self._queue)
+        background_running = sum(1 for job in self._running if job.priority <= PRIORITY_BACKGROUND)
+        for job in self._ordered_queue():
+            if job.priority <= PRIORITY_BACKGROUND and (foreground_waiting or background_running >= Config.BACKGROUND_MAX_JOBS):
+                continue
+            # A job bigger than the whole budget still runs, but only on its own
+            if not self._running or memory_in_use + job.memory_bytes <= self.memory_budget:
+                return job
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                self._queue.remove(job)
+                self._running.append(job)
+                job.status = "running"
+                job.started_at = time.time()
+
+            try:
+                job.cancel_token.raise_if_cancelled()
+                job.result = job.func(job)
+                job.status = "done"
+            except JobCancelled:
+                job.status = "cancelled"
+            except Exception as e:
+                job.traceback = traceback.format_exc()
+                # The formatted traceback is kept; the frames would keep func's locals alive
+                job.error = e.with_traceback(None)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                job.func = None
+                with self._cond:
+                    self._running.remove(job)
+                    # Freed memory may let a queued job start
+                    self._cond.notify_all()
+                job._finished.set()
+
+
+_shared_scheduler = None
+_shared_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Returns the process-wide JobScheduler (shared by all Streamlit sessions).
+    """
+    global _shared_scheduler
+    with _shared_scheduler_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = JobScheduler()
+        return _shared_scheduler
@@ -0,0 +1,146 @@
+import atexit
+import os
+import threading
+import uuid
+from multiprocessing import shared_memory
+
+from .config import Config
+
+# /dev/shm is where POSIX shared memory segments live on Linux
+_SHM_DIR = "/dev/shm"
+
+
+class RasterRef:
+    """
+    Picklable handle of a SharedRaster: what gets sent to another process
+    instead of the pixels themselves.
+    """
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+    def attach(self):
+        """
+        Maps the segment in this process.
+        Returns (segment, numpy view); close the segment when done with the view,
+        the owner unlinks it.
+        """
+        import numpy as np
+
+        segment = shared_memory.SharedMemory(name=self.name)
+        return segment, np.ndarray(self.shape, dtype=self.dtype, buffer=segment.buf)
+
+
+class SharedRaster:
+    """
+    A numpy raster in a named shared memory segment, so worker processes can
+    read it without pickling and copying the pixels.
+    The creating process owns the segment: consumers only attach to it by ref
+    and close their mapping. The owner unlinks it with release(), at exit,
+    or, if the process died without cleaning up, the next
+    sweep_stale_segments() does.
+    """
+
+    def __init__(self, shape, dtype="uint8"):
+        import numpy as np
+
+        size = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        # The owner's pid is part of the name, so stale segments can be told apart
+        name = f"{Config.SHM_PREFIX}_{os.getpid()}_{uuid.uuid4().hex[:12]}"
+        self._segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.ref = RasterRef(self._segment.name, tuple(shape), str(np.dtype(dtype)))
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self._segment.buf)
+
+        self._lock = threading.Lock()
+        _registry.add(self)
+
+    @classmethod
+    def from_array(cls, arr):
+        """
+        Copies arr into a new shared segment.
+        """
+        raster = cls(arr.shape, arr.dtype)
+        raster.array[...] = arr
+        return raster
+
+    def release(self):
+        """
+        Unmaps and unlinks the segment; safe to call more than once.
+        """
+        with self._lock:
+            if self._segment is None:
+                return
+            self.array = None # Views must go before the buffer can be closed
+            try:
+                self._segment.close()
+                self._segment.unlink()
+            except (BufferError, FileNotFoundError):
+                pass
+            self._segment = None
+        _registry.discard(self)
+
+
+class _Registry:
+    # Segments owned by this process, unlinked at exit
+    def __init__(self):
+        self._rasters = set()
+        self._lock = threading.Lock()
+        atexit.register(self.close_all)
+
+    def add(self, raster):
+        with self._lock:
+            self._rasters.add(raster)
+
+    def discard(self, raster):
+        with self._lock:
+            self._rasters.discard(raster)
+
+    def close_all(self):
+        with self._lock:
+            rasters = list(self._rasters)
+        for raster in rasters:
+            raster.release()
+
+
+_registry = _Registry()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def sweep_stale_segments():
+    """
+    Unlinks segments left behind by processes that died without cleaning up
+    (e.g. killed by the OOM killer). Returns the number removed.
+    Only possible where segments are visible as files (Linux).
+    """
+    if not os.path.isdir(_SHM_DIR):
+        return 0
+    removed = 0
+    prefix = f"{Config.SHM_PREFIX}_"
+    for name in os.listdir(_SHM_DIR):
+        if not name.startswith(prefix):
+            continue
+        try:
+            pid = int(name[len(prefix):].split("_", 1)[0])
+        except ValueError:
+            continue
+        if pid == os.getpid() or _pid_alive(pid):
+            continue
+        try:
+            os.remove(os.path.join(_SHM_DIR, name))
+            removed += 1
+        except OSError:
+            pass
+    if removed:
+        print(f"Removed {removed} stale shared memory segment(s)")
+    return removed
@@ -1,6 +1,4 @@
 import streamlit as st
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime
 import traceback
 import pytz
@@ -14,6 +12,10 @@ class UsageTracker:
         try:
             # Check if secrets are available
             if "gcp_service_account" in st.secrets:
+                # Only pay for the Google client libraries when tracking is configured
+                import gspread
+                from oauth2client.service_account import ServiceAccountCredentials
+
                 # Create credentials object from secrets
                 scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
                 creds_dict = dict(st.secrets["gcp_service_account"])
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+from .config import Config
+
+
+class WorkspaceManager:
+    """
+    Hands out isolated per-job directories under Config.WORKSPACE_DIR.
+    Tracks the bytes in use and evicts old workspaces, first by TTL and then
+    least-recently-used, so the total stays within the disk quota.
+    A workspace's directory mtime is its last access time (see touch).
+    """
+
+    def __init__(self, root=None, quota_bytes=None, ttl_seconds=None):
+        self.root = root or Config.WORKSPACE_DIR
+        self.quota_bytes = quota_bytes or Config.WORKSPACE_QUOTA_BYTES
+        self.ttl_seconds = ttl_seconds or Config.WORKSPACE_TTL_SECONDS
+        os.makedirs(self.root, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._last_evict = 0.0
+
+    def workspace(self, name):
+        """
+        Returns the directory of workspace name, creating it if needed.
+        """
+        path = os.path.join(self.root, name)
+        os.makedirs(path, exist_ok=True)
+        self.touch(path)
+        self.maybe_evict()
+        return path
+
+    def touch(self, path):
+        """
+        Marks a workspace (or a file inside one) as recently used.
+        """
+        if not os.path.isdir(path):
+            path = os.path.dirname(path)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def store_upload(self, data, filename):
+        """
+        Stores uploaded bytes in a workspace keyed by their hash and returns the file path.
+        Re-uploading the same file (or rerunning the script) reuses the stored copy.
+        """
+        digest = hashlib.sha256(data).hexdigest()[:24]
+        path = os.path.join(self.workspace(f"upload-{digest}"), os.path.basename(filename))
+        if not os.path.exists(path):
+            tmp_path = f"{path}.tmp{os.getpid()}_{threading.get_ident()}"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return path
+
+    def usage(self):
+        """
+        Returns a list of (path, size_bytes, last_access) for every workspace.
+        """
+        workspaces = []
+        for entry in os.scandir(self.root):
+            if not entry.is_dir():
+                continue
+            size = 0
+            for dirpath, _, filenames in os.walk(entry.path):
+                for filename in filenames:
+                    try:
+                        size += os.path.getsize(os.path.join(dirpath, filename))
+                    except OSError:
+                        pass
+            try:
+                last_access = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            workspaces.append((entry.path, size, last_access))
+        return workspaces
+
+    def maybe_evict(self):
+        # Scanning the tree isn't free, so don't do it on every call
+        if time.time() - self._last_evict < Config.WORKSPACE_EVICT_INTERVAL:
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Removes expired workspaces, then the least recently used ones until under quota.
+        Workspaces used within WORKSPACE_GRACE_SECONDS are never removed.
+        Returns the number of bytes freed.
+        """
+        with self._lock:
+            self._last_evict = now = time.time()
+            workspaces = sorted(self.usage(), key=lambda item: item[2])
+            total = sum(size for _, size, _ in workspaces)
+            freed = 0
+
+            for path, size, last_access in workspaces:
+                age = now - last_access
+                if age < Config.WORKSPACE_GRACE_SECONDS:
+                    break # Sorted by last access, everything after is newer
+                if age < self.ttl_seconds and total - freed <= self.quota_bytes:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                freed += size
+
+            if freed:
+                print(f"Workspace eviction: freed {freed / 1024 / 1024:.1f} MB")
+            return freed
+
+
+_shared_manager = None
+_shared_manager_lock = threading.Lock()
+
+
+def get_workspace_manager():
+    """
+    Returns the process-wide WorkspaceManager.
+    """
+    global _shared_manager
+    with _shared_manager_lock:
+        if _shared_manager is None:
+            _shared_manager = WorkspaceManager()
+        return _shared_manager